@@ -0,0 +1,226 @@
+"""
+Benchmarks for the trace engine and the editor redraw.
+
+Scenes come from seeded generators, so a run is reproducible across commits:
+
+    python bench.py -o before.json
+    python bench.py -o after.json --compare before.json
+
+The redraw benchmark needs Tk and a display (use xvfb-run on CI), it is skipped otherwise.
+"""
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import prism
+
+SIZES = (10, 100, 1000, 10000, 100000)
+
+# --- SCENE GENERATORS ---
+# Each returns (starts, prisms_list, params) for about n prisms.
+
+def _prism(pid, x, y, angle, p_type="normal", factor=1.0):
+    return {'id': pid, 'x': round(x, 3), 'y': round(y, 3), 'angle': angle, 'type': p_type, 'intensity_factor': factor}
+
+def chain_scene(n, seed=0):
+    """One beam through n normal prisms, each turned towards the next (random walk)."""
+    r = random.Random(seed)
+    points, heading = [(0.0, 0.0)], 0.0
+    for _ in range(n):
+        heading += r.uniform(-60, 60)
+        step = r.uniform(10, 20)
+        x, y = points[-1]
+        points.append((x + step * math.cos(math.radians(heading)), y + step * math.sin(math.radians(heading))))
+    points = [(round(x, 3), round(y, 3)) for x, y in points]
+    directions = [math.degrees(math.atan2(y2 - y1, x2 - x1)) for (x1, y1), (x2, y2) in zip(points, points[1:])]
+    prisms_list = [_prism(k + 1, *points[k + 1], (directions[k + 1] - directions[k]) if k + 1 < n else 0.0) for k in range(n)]
+    starts = [{'id': 1, 'x': points[0][0], 'y': points[0][1], 'angle': directions[0]}]
+    return starts, prisms_list, {'angle_tolerance': 0.01, 'max_iterations': n + 10}
+
+def _lattice(n, spacing=10):
+    side = max(1, math.isqrt(n))
+    return [(spacing * (k % side), spacing * (k // side)) for k in range(n)], side
+
+def splitter_scene(n, seed=0):
+    """Splitters at 90 degrees on a square lattice: every hit forks the beam along both axes."""
+    r = random.Random(seed)
+    cells, side = _lattice(n)
+    prisms_list = [_prism(k + 1, x, y, 90, "splitter", r.choice((1.0, 1.5))) for k, (x, y) in enumerate(cells)]
+    starts = [{'id': 1, 'x': -10, 'y': 10 * (side // 2), 'angle': 0}]
+    return starts, prisms_list, {'angle_tolerance': 0.01, 'max_iterations': 4 * n + 10, 'attenuation_threshold': 1e-6}
+
+def combiner_scene(n, seed=0):
+    """Lattice mixing splitters and combiners, so forked beams keep merging back."""
+    r = random.Random(seed)
+    cells, side = _lattice(n)
+    prisms_list = [_prism(k + 1, x, y, 90, "combiner" if r.random() < 0.2 else "splitter", 1.0) for k, (x, y) in enumerate(cells)]
+    mid, off = 10 * (side // 2), 10 * (side > 2)
+    # One laser from each side so beams cross and combiners get their second input.
+    starts = [{'id': 1, 'x': -10, 'y': mid, 'angle': 0}, {'id': 2, 'x': mid, 'y': -10, 'angle': 90},
+              {'id': 3, 'x': 10 * side, 'y': mid + off, 'angle': 180}, {'id': 4, 'x': mid + off, 'y': 10 * side, 'angle': -90}]
+    return starts, prisms_list, {'angle_tolerance': 0.01, 'max_iterations': 4 * n + 10, 'attenuation_threshold': 1e-6}
+
+def loop_scene(n, seed=0):
+    """n normal prisms on a circle, each turning the beam by 360/n: the beam loops forever."""
+    radius = 10 * n / (2 * math.pi)
+    vertices = [(radius * math.cos(2 * math.pi * k / n), radius * math.sin(2 * math.pi * k / n)) for k in range(n)]
+    prisms_list = [_prism(k + 1, x, y, 360 / n) for k, (x, y) in enumerate(vertices)]
+    (x1, y1), (x2, y2) = (prisms_list[-1]['x'], prisms_list[-1]['y']), (prisms_list[0]['x'], prisms_list[0]['y'])
+    starts = [{'id': 1, 'x': (x1 + x2) / 2, 'y': (y1 + y2) / 2, 'angle': math.degrees(math.atan2(y2 - y1, x2 - x1))}]
+    return starts, prisms_list, {'angle_tolerance': 0.5, 'max_iterations': 3 * n + 10}
+
+def cloud_scene(n, seed=0, lasers=4):
+    """Uniform random cloud of all prism types, lasers aimed at random prisms."""
+    r = random.Random(seed)
+    spread = 10 * math.sqrt(n)
+    prisms_list = []
+    for k in range(n):
+        p_type = r.choice(prism.PRISM_TYPES)
+        factor = 1.0 if p_type == "normal" else (r.uniform(1.1, 2) if p_type == "amplifier" else r.uniform(0.3, 1))
+        prisms_list.append(_prism(k + 1, r.uniform(-spread, spread), r.uniform(-spread, spread), r.choice((45, 90, -90, 135, r.uniform(-180, 180))), p_type, factor))
+    starts = []
+    for k in range(lasers):
+        target = r.choice(prisms_list)
+        x, y = r.uniform(-spread, spread), r.uniform(-spread, spread)
+        starts.append({'id': k + 1, 'x': x, 'y': y, 'angle': math.degrees(math.atan2(target['y'] - y, target['x'] - x))})
+    return starts, prisms_list, {'angle_tolerance': 1, 'max_iterations': 2000}
+
+def lasers_scene(n, seed=0):
+    """Dense cloud lit by many lasers (one per ten prisms, at most 1000)."""
+    starts, prisms_list, params = cloud_scene(n, seed, lasers=min(1000, max(1, n // 10)))
+    return starts, prisms_list, {**params, 'max_iterations': 20 * len(starts)}
+
+SCENES = {
+    'chain': chain_scene,
+    'splitters': splitter_scene,
+    'combiners': combiner_scene,
+    'loop': loop_scene,
+    'cloud': cloud_scene,
+    'lasers': lasers_scene,
+}
+
+# --- MEASUREMENTS ---
+
+def best_time(fn, repeat):
+    best, value = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, value
+
+def bench_trace(scene, n, starts, prisms_list, params, repeat, engine="python"):
+    seconds, results = best_time(lambda: prism.calculate_all_paths(starts, prisms_list, engine=engine, **params), repeat)
+    tracemalloc.start()
+    prism.calculate_all_paths(starts, prisms_list, engine=engine, **params)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    segments = sum(len(res['segments']) for res in results)
+    return {'bench': f"trace_{engine}", 'scene': scene, 'n': n, 'seconds': seconds, 'peak_bytes': peak,
+            'segments': segments, 'segments_per_sec': segments / seconds if seconds > 0 else None}
+
+def bench_find_next_hit(scene, n, prisms_list, params, repeat, queries=1000):
+    r = random.Random(n)
+    spread = max(max(abs(p['x']), abs(p['y'])) for p in prisms_list)
+    rays = [(r.uniform(-spread, spread), r.uniform(-spread, spread), r.uniform(-180, 180)) for _ in range(queries)]
+    tol = params['angle_tolerance']
+    out = []
+    for name, index in (("grid", prism.PrismGrid(prisms_list)), ("arrays", prism.PrismArrays(prisms_list))):
+        seconds, _ = best_time(lambda: [index.find_next_hit(x, y, a, tol) for x, y, a in rays], repeat)
+        out.append({'bench': f"find_next_hit_{name}", 'scene': scene, 'n': n, 'seconds': seconds, 'queries': queries,
+                    'queries_per_sec': queries / seconds if seconds > 0 else None})
+    return out
+
+def bench_redraw(scene, n, starts, prisms_list, params, repeat):
+    """Times draw_scene in a real Tk editor: first trace plus render, cached redraw and render only."""
+    import tkinter as tk
+    import editor
+    root = tk.Tk()
+    try:
+        app = editor.AdvancedPrismEditor(root)
+        app.prisms, app.start_configs = prism.Scene(prisms_list), starts
+        app.angle_tolerance, app.max_iterations = params['angle_tolerance'], params['max_iterations']
+        app.attenuation_threshold = params.get('attenuation_threshold', 0.01)
+        root.update()
+        app.center_and_zoom_on_content()
+
+        t0 = time.perf_counter()
+        app.draw_scene()
+        while app.shown_request != app.trace_request: # Wait for the background trace to be displayed
+            root.update()
+            time.sleep(0.001)
+        first = time.perf_counter() - t0
+        cached, _ = best_time(lambda: (app.draw_scene(), root.update_idletasks()), repeat)
+        render, _ = best_time(lambda: app.render_scene(False), repeat)
+        return {'bench': "redraw", 'scene': scene, 'n': n, 'seconds': first, 'cached_seconds': cached,
+                'render_seconds': render, 'canvas_items': len(app.canvas.find_all())}
+    finally:
+        root.destroy()
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'platform': platform.platform(), 'time': time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def compare(results, baseline):
+    """Prints the time ratio of every benchmark also present in the baseline."""
+    old = {(b['bench'], b['scene'], b['n']): b['seconds'] for b in baseline['results']}
+    for b in results:
+        before = old.get((b['bench'], b['scene'], b['n']))
+        if before and b['seconds']:
+            print(f"{b['bench']:<22} {b['scene']:<10} {b['n']:>7}  {before:9.4f}s -> {b['seconds']:9.4f}s  x{before / b['seconds']:.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the prism trace engine and editor redraw.")
+    parser.add_argument("--scenes", nargs="+", choices=sorted(SCENES), default=list(SCENES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=("python", "numpy"), default="python")
+    parser.add_argument("--no-redraw", action="store_true", help="skip the Tk redraw benchmark")
+    parser.add_argument("--redraw-max", type=int, default=10000, help="largest scene drawn by the redraw benchmark")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    redraw = not args.no_redraw
+    results = []
+    for scene in args.scenes:
+        for n in args.sizes:
+            starts, prisms_list, params = SCENES[scene](n, args.seed)
+            runs = [bench_trace(scene, n, starts, prisms_list, params, args.repeat, args.engine)]
+            if scene == "cloud":
+                runs += bench_find_next_hit(scene, n, prisms_list, params, args.repeat)
+            if redraw and n <= args.redraw_max:
+                try:
+                    runs.append(bench_redraw(scene, n, starts, prisms_list, params, args.repeat))
+                except Exception as e: # No Tk or no display
+                    print(f"Redraw benchmark skipped: {e}", file=sys.stderr)
+                    redraw = False
+            for b in runs:
+                extra = "".join(f"  {k}={v:.4g}" if isinstance(v, float) else f"  {k}={v}" for k, v in b.items() if k not in ('bench', 'scene', 'n', 'seconds'))
+                print(f"{b['bench']:<22} {scene:<10} {n:>7}  {b['seconds']:9.4f}s{extra}")
+            results.extend(runs)
+
+    report = {'environment': environment(), 'args': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
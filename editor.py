@@ -2,12 +2,571 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import math
 import json
-import copy
 import os
 import datetime
+import time
+import threading
+import queue
+from itertools import product
+import numpy as np
 import prism
 
+class TraceWorker:
+    """
+    Runs prism traces on a background thread so the Tk main loop never blocks.
+
+    submit() hands over a snapshot of the scene with the scene key and a caller tag;
+    it replaces a request still waiting to start and cancels a trace already running,
+    whose stale results are dropped. A request with the key of the trace waiting or
+    running only retags it, so redraws of an unchanged scene never restart a trace.
+    poll() returns the newest finished (tag, results, trace seconds), if any.
+    """
+    def __init__(self):
+        self.session = prism.TraceSession()
+        self.cond = threading.Condition()
+        self.pending = None # (key, tag, snapshot) waiting to start
+        self.running = None # (key, tag) of the trace in progress
+        self.finished = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def submit(self, key, tag, starts, scene, *params):
+        with self.cond:
+            if self.pending is not None and self.pending[0] == key:
+                self.pending = (key, tag, self.pending[2])
+                return
+            if self.pending is None and self.running is not None and self.running[0] == key:
+                self.running = (key, tag)
+                return
+        snapshot = ([dict(s) for s in starts], scene.copy()) + params
+        with self.cond:
+            self.pending = (key, tag, snapshot)
+            self.cond.notify()
+
+    def poll(self):
+        with self.cond:
+            finished, self.finished = self.finished, None
+            return finished
+
+    def idle(self):
+        with self.cond:
+            return self.pending is None and self.running is None and self.finished is None
+
+    def superseded(self):
+        # Polled by the trace between hit tests; reading one attribute needs no lock.
+        return self.pending is not None
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                key, tag, snapshot = self.pending
+                self.pending = None
+                self.running = (key, tag)
+            t0 = time.perf_counter()
+            try:
+                results = self.session.trace(*snapshot, cancel=self.superseded)
+            except Exception as e:
+                print(f"Trace failed: {e}")
+                self.session.reset()
+                results = None
+            with self.cond:
+                _, tag = self.running
+                self.running = None
+                if results is not None:
+                    self.finished = (tag, results, time.perf_counter() - t0)
+
+class RetainedScene:
+    """
+    Retained-mode scene graph over a Tk canvas.
+
+    Every drawable is addressed by a stable key (prism id, laser id, segment index...)
+    mapped to a persistent canvas item. A render pass calls put() for each key it
+    wants on screen; only items whose coordinates or options changed are touched,
+    and keys not put during the pass are deleted by end(). View changes are applied
+    with a single canvas.move/canvas.scale through move() and scale().
+    """
+    LAYERS = ("paths", "ghost", "prisms", "lasers") # Bottom to top
+
+    def __init__(self, canvas, tag="scene"):
+        self.canvas = canvas
+        self.tag = tag
+        self.items = {} # key -> [item_id, kind, coords, options]
+        self.seen = set()
+        self.created = False
+
+    def begin(self):
+        self.seen = set()
+        self.created = False
+
+    def put(self, key, kind, coords, layer, **options):
+        self.seen.add(key)
+        entry = self.items.get(key)
+        if entry is None or entry[1] != kind:
+            if entry is not None:
+                self.canvas.delete(entry[0])
+            create = getattr(self.canvas, "create_" + kind)
+            item = create(*coords, tags=(self.tag, layer), **options)
+            self.items[key] = [item, kind, coords, options]
+            self.created = True
+            return
+        if len(coords) != len(entry[2]) or any(abs(a - b) >= 0.5 for a, b in zip(coords, entry[2])):
+            self.canvas.coords(entry[0], *coords)
+            entry[2] = coords
+        if options != entry[3]:
+            self.canvas.itemconfig(entry[0], **options)
+            entry[3] = options
+
+    def end(self):
+        for key in [k for k in self.items if k not in self.seen]:
+            self.canvas.delete(self.items.pop(key)[0])
+        if self.created:
+            # New items land on top of the stack, restore the layer order.
+            for layer in self.LAYERS[1:]:
+                self.canvas.tag_raise(layer)
+
+    def move(self, dx, dy):
+        self.canvas.move(self.tag, dx, dy)
+        for entry in self.items.values():
+            entry[2] = [v + (dx if k % 2 == 0 else dy) for k, v in enumerate(entry[2])]
+
+    def scale(self, x0, y0, factor):
+        self.canvas.scale(self.tag, x0, y0, factor, factor)
+        for entry in self.items.values():
+            entry[2] = [(x0 if k % 2 == 0 else y0) + (v - (x0 if k % 2 == 0 else y0)) * factor for k, v in enumerate(entry[2])]
+
+class SpatialIndex:
+    """
+    Point-pick and rectangle queries over the prisms of a prism.Scene.
+
+    Prism ids are bucketed by grid cell, like prism.PrismGrid. The index follows the
+    Scene's log of moved ids (Scene.moved_since), so an edit only re-buckets the
+    prisms it moved, inserted or deleted and a drag frame costs as much as the drag,
+    whatever the scene size. A new Scene, or an edit touching a large part of it, is
+    bucketed from scratch with a few NumPy passes on the next query. A rectangle
+    spanning many cells is answered by one vectorized pass over the columns instead.
+    """
+    CELL = 8.0 # Logical units, at least the pick radius so a pick spans 2x2 cells
+    SCAN_RATIO = 16 # A rectangle over more than 1/SCAN_RATIO of the occupied cells scans the columns
+
+    def __init__(self):
+        self.scene = None
+        self.version = None
+        self.cells = {} # cell key (see cell_key) -> list of prism ids
+        self.cell_of = {} # prism id -> cell key
+
+    def sync(self, scene):
+        if scene is self.scene and scene.version == self.version: return
+        moved = scene.moved_since(self.version) if scene is self.scene else None
+        self.scene, self.version = scene, scene.version
+        if moved is None or len(moved) * 4 > len(scene):
+            self.rebuild(scene)
+            return
+        cells, cell_of, rows, xs, ys, cs = self.cells, self.cell_of, scene.rows, scene.x, scene.y, self.CELL
+        for pid in moved:
+            old = cell_of.pop(pid, None)
+            if old is not None:
+                bucket = cells[old]
+                bucket.remove(pid)
+                if not bucket: del cells[old]
+            row = rows.get(pid)
+            if row is not None:
+                key = cell_of[pid] = self.cell_key(math.floor(xs[row] / cs), math.floor(ys[row] / cs))
+                bucket = cells.get(key)
+                if bucket is None: cells[key] = [pid]
+                else: bucket.append(pid)
+
+    @staticmethod
+    def cell_key(kx, ky):
+        """Packs cell coordinates into one int (works on NumPy int64 arrays too)."""
+        return (kx << 32) + (ky & 0xFFFFFFFF)
+
+    def rebuild(self, scene):
+        kx = np.floor(scene.column('x') / self.CELL).astype(np.int64)
+        ky = np.floor(scene.column('y') / self.CELL).astype(np.int64)
+        keys = self.cell_key(kx, ky)
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        bounds = [0] + (np.flatnonzero(keys[1:] != keys[:-1]) + 1).tolist() + [len(keys)]
+        keys, ids = keys.tolist(), scene.column('id')[order].tolist()
+        self.cell_of = dict(zip(ids, keys))
+        self.cells = {keys[a]: ids[a:b] for a, b in zip(bounds, bounds[1:]) if b > a}
+
+    def pick(self, scene, x, y, radius):
+        """Row of the first prism, in scene order, closer than radius to (x, y), or None."""
+        self.sync(scene)
+        best = None
+        rows, xs, ys = scene.rows, scene.x, scene.y
+        kx0, kx1 = math.floor((x - radius) / self.CELL), math.floor((x + radius) / self.CELL)
+        ky0, ky1 = math.floor((y - radius) / self.CELL), math.floor((y + radius) / self.CELL)
+        for kx in range(kx0, kx1 + 1):
+            for ky in range(ky0, ky1 + 1):
+                for pid in self.cells.get(self.cell_key(kx, ky), ()):
+                    row = rows[pid]
+                    if (best is None or row < best) and math.sqrt((xs[row] - x)**2 + (ys[row] - y)**2) < radius:
+                        best = row
+        return best
+
+    def rect(self, scene, x1, y1, x2, y2):
+        """Rows of the prisms inside the rectangle (borders included), in scene order."""
+        self.sync(scene)
+        x1, x2, y1, y2 = min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2)
+        cs, cells = self.CELL, self.cells
+        kx0, kx1, ky0, ky1 = math.floor(x1 / cs), math.floor(x2 / cs), math.floor(y1 / cs), math.floor(y2 / cs)
+        if (kx1 - kx0 + 1) * (ky1 - ky0 + 1) * self.SCAN_RATIO > len(cells):
+            xs, ys = scene.column('x'), scene.column('y')
+            return np.flatnonzero((xs >= x1) & (xs <= x2) & (ys >= y1) & (ys <= y2)).tolist()
+        found, rows, xs, ys = [], scene.rows, scene.x, scene.y
+        for kx, ky in product(range(kx0, kx1 + 1), range(ky0, ky1 + 1)):
+            bucket = cells.get(self.cell_key(kx, ky))
+            if bucket is None: continue
+            if kx0 < kx < kx1 and ky0 < ky < ky1: # Cell fully inside, no test needed
+                found.extend(rows[pid] for pid in bucket)
+                continue
+            for pid in bucket:
+                row = rows[pid]
+                if x1 <= xs[row] <= x2 and y1 <= ys[row] <= y2:
+                    found.append(row)
+        found.sort()
+        return found
+
+class VirtualList:
+    """
+    Treeview showing a window over a long list of rows.
+
+    Only the rows in the window exist as Treeview items; the scrollbar and the mouse
+    wheel move the window instead of the Treeview. refresh() diffs the window against
+    the items on screen by iid and only inserts, deletes, moves or updates the rows
+    that differ, so its cost depends on the window height, not on the list length.
+    count() gives the number of rows, row(i) the (iid, values) of row i and
+    index(iid) the row of an iid (None if absent). The selection is kept as a set of
+    iids, so rows selected and then scrolled out of the window stay selected.
+    """
+    ROW_PX = 20 # Default ttk row height and heading height, to fit the window to the widget
+    HEADING_PX = 24
+
+    def __init__(self, tree, scrollbar, count, row, index):
+        self.tree, self.scrollbar = tree, scrollbar
+        self.count, self.row, self.index = count, row, index
+        self.top = 0
+        self.height = int(tree.cget("height") or 10)
+        self.shown = [] # (iid, values) of the Treeview items, in order
+        self.selection = set() # Selected iids, on screen or not
+        self.echo = () # Treeview selection last set by refresh(), to tell it from user clicks
+        self.extending = False # Shift or Control held at the last click or key press
+        scrollbar.configure(command=self.yview)
+        for event in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(event, self.on_wheel)
+        for event in ("<ButtonPress-1>", "<KeyPress>"):
+            tree.bind(event, self.on_modifiers, add="+")
+        tree.bind("<Configure>", self.on_resize)
+
+    def refresh(self, selection=None, see=None):
+        """Updates the window, optionally with a new selection and scrolled to show iid see."""
+        if selection is not None: self.selection = selection
+        n = self.count()
+        row = self.index(see) if see is not None else None
+        if row is not None:
+            if row < self.top: self.top = row
+            elif row >= self.top + self.height: self.top = row - self.height + 1
+        self.top = max(0, min(self.top, n - self.height))
+        window = [self.row(i) for i in range(self.top, min(n, self.top + self.height))]
+
+        tree = self.tree
+        old = dict(self.shown)
+        wanted = {iid for iid, _ in window}
+        gone = [iid for iid in old if iid not in wanted]
+        if gone: tree.delete(*gone)
+        order = [iid for iid, _ in self.shown if iid in wanted]
+        for pos, (iid, values) in enumerate(window):
+            if iid not in old:
+                tree.insert("", pos, iid=iid, values=values)
+                order.insert(pos, iid)
+                continue
+            if old[iid] != values:
+                tree.item(iid, values=values)
+            if order[pos] != iid:
+                tree.move(iid, "", pos)
+                order.remove(iid)
+                order.insert(pos, iid)
+        self.shown = window
+
+        selected = tuple(iid for iid, _ in window if iid in self.selection)
+        if selected != tuple(tree.selection()):
+            tree.selection_set(selected)
+        self.echo = selected
+        self.scrollbar.set(self.top / n if n else 0.0, min(1.0, (self.top + self.height) / n) if n else 1.0)
+
+    def show(self, iid, selection=None):
+        """Scrolls to iid and gives it the keyboard focus."""
+        self.refresh(selection, see=iid)
+        if iid in dict(self.shown): self.tree.focus(iid)
+
+    def user_selection(self):
+        """
+        The selected iids after the user changed the Treeview selection, None if it is
+        the one refresh() set. The Treeview only holds the window: rows selected off it
+        stay selected when Shift or Control was held, and are dropped otherwise.
+        """
+        selected = tuple(self.tree.selection())
+        if selected == self.echo: return None
+        self.echo = selected
+        shown = {iid for iid, _ in self.shown}
+        kept = {iid for iid in self.selection if iid not in shown} if self.extending else set()
+        self.selection = kept | set(selected)
+        return self.selection
+
+    def on_modifiers(self, event):
+        self.extending = bool(event.state & 0x0005) and self.tree.cget("selectmode") != "browse" # Shift, Control
+
+    def yview(self, *args):
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * self.count())
+        elif args[0] == "scroll":
+            self.top += int(args[1]) * (self.height if args[2] == "pages" else 1)
+        self.refresh()
+
+    def on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        self.yview("scroll", -3 if up else 3, "units")
+        return "break"
+
+    def on_resize(self, event):
+        height = max(1, (event.height - self.HEADING_PX) // self.ROW_PX + 1)
+        if height != self.height:
+            self.height = height
+            self.refresh()
+
+def apply_changes(collections, changes, find):
+    """
+    Applies patch changes (collection, id, old fields, new fields, list position) to
+    collections {name: list of item dicts, or a prism.Scene}, moving each item from old
+    to new. None fields mean the item is absent and id None a whole-collection
+    replacement. Updated items and Scenes change in place, lists that lose or regain
+    items are replaced in collections.
+    """
+    removed, restored = {}, {}
+    for collection, item_id, old, new, pos in sorted(changes, key=lambda c: c[1] is not None):
+        if item_id is None:
+            collections[collection] = prism.Scene(new) if isinstance(collections[collection], prism.Scene) else [dict(x) for x in new]
+        elif new is None:
+            removed.setdefault(collection, set()).add(item_id)
+        elif old is None:
+            restored.setdefault(collection, []).append((pos, dict(new)))
+        else:
+            item = find(collection, item_id)
+            if isinstance(item, dict): item.clear() # Scene rows always hold every field
+            item.update(new)
+    for collection, ids in removed.items():
+        items = collections[collection]
+        if isinstance(items, prism.Scene):
+            items.delete(ids)
+        else:
+            collections[collection] = [x for x in items if x['id'] not in ids]
+    for collection, entries in restored.items():
+        items = collections[collection]
+        if not isinstance(items, prism.Scene): items = list(items)
+        for pos, item in sorted((e for e in entries if e[0] is not None), key=lambda e: e[0]):
+            items.insert(pos, item)
+        items.extend(item for pos, item in entries if pos is None) # Inserts are appends
+        collections[collection] = items
+    return collections
+
+class UndoHistory:
+    """
+    Undo/redo as a list of patches instead of scene snapshots.
+
+    Edits report the prisms and lasers they are about to change or delete, or have just
+    inserted; commit() turns them into one patch holding only their fields before and
+    after. Undo and redo cost as much as the edit did, so history needs no depth cap.
+    Collections are named by the editor attribute holding them ("prisms", "start_configs").
+    """
+    META = ("next_id", "next_start_id", "active_start_idx")
+
+    def __init__(self, editor):
+        self.editor = editor
+        self.patches = [] # (changes, meta before, meta after)
+        self.index = 0 # patches[:index] are applied
+        self.pending = {} # (collection, id) -> [fields before or None, list position before]
+        self.meta = self.read_meta()
+        self.journal = None # Changes applied since the last autosave, while autosave is on
+
+    def read_meta(self):
+        return tuple(getattr(self.editor, name) for name in self.META)
+
+    def changing(self, collection, item):
+        self.pending.setdefault((collection, item['id']), [dict(item), None])
+
+    def deleting(self, collection, item, pos):
+        self.pending.setdefault((collection, item['id']), [dict(item), None])[1] = pos
+
+    def inserted(self, collection, item):
+        self.pending.setdefault((collection, item['id']), [None, None])
+
+    def replacing(self, collection):
+        """Whole-collection edit (load, clear): records every item once instead of per-item patches."""
+        self.pending = {key: entry for key, entry in self.pending.items() if key[0] != collection}
+        self.pending[(collection, None)] = [[dict(x) for x in getattr(self.editor, collection)], None]
+
+    def commit(self):
+        changes = []
+        for (collection, item_id), (before, pos) in self.pending.items():
+            if item_id is None:
+                after = [dict(x) for x in getattr(self.editor, collection)]
+            else:
+                item = self.find(collection, item_id)
+                after = dict(item) if item is not None else None
+            if before != after:
+                changes.append((collection, item_id, before, after, pos))
+        self.pending = {}
+        meta = self.read_meta()
+        if not changes and meta == self.meta: return
+        del self.patches[self.index:]
+        self.patches.append((changes, self.meta, meta))
+        self.index += 1
+        self.meta = meta
+        if self.journal is not None: self.journal.append(changes)
+
+    def undo(self):
+        if self.index == 0: return False
+        self.index -= 1
+        changes, meta_before, _ = self.patches[self.index]
+        self.apply([(c, item_id, after, before, pos) for c, item_id, before, after, pos in changes], meta_before)
+        return True
+
+    def redo(self):
+        if self.index == len(self.patches): return False
+        changes, _, meta_after = self.patches[self.index]
+        self.index += 1
+        self.apply(changes, meta_after)
+        return True
+
+    def apply(self, changes, meta):
+        """Moves every change from its first to its second state (undo passes them swapped)."""
+        collections = {c[0]: getattr(self.editor, c[0]) for c in changes}
+        for collection, items in apply_changes(collections, changes, self.find).items():
+            setattr(self.editor, collection, items)
+        for name, value in zip(self.META, meta):
+            setattr(self.editor, name, value)
+        self.pending = {}
+        self.meta = meta
+        if self.journal is not None: self.journal.append(changes)
+
+    def find(self, collection, item_id):
+        if collection == "prisms":
+            return self.editor.prism_by_id(item_id)
+        return next((x for x in getattr(self.editor, collection) if x['id'] == item_id), None)
+
+class Autosaver:
+    """
+    Writes autosaves on a background thread.
+
+    A checkpoint is the full scene, written to a temp file and renamed over the
+    autosave so a crash never leaves it half written. Between checkpoints, only the
+    undo patches applied since the previous save are appended to a journal next to it;
+    recover() replays that journal onto a loaded checkpoint.
+    """
+    CHECKPOINT_EVERY = 200 # Journaled patches before the next full checkpoint
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.journal_path = os.path.splitext(filepath)[0] + ".journal"
+        self.jobs = queue.Queue()
+        self.generation = None # Stamp of the checkpoint the journal extends, None forces a checkpoint
+        self.journaled = 0
+        self.params = None
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def reset(self):
+        self.generation = None
+
+    def save(self, changes, params, snapshot):
+        """
+        changes: patches applied since the last save. snapshot() returns the full scene
+        data and is only called when a checkpoint is due. Returns False if nothing changed.
+        """
+        if self.generation is not None and params == self.params:
+            if not changes: return False
+            if self.journaled + len(changes) <= self.CHECKPOINT_EVERY:
+                self.journaled += len(changes)
+                self.jobs.put(("journal", self.generation, changes))
+                return True
+        self.generation = datetime.datetime.now().isoformat()
+        self.params, self.journaled = params, 0
+        data = snapshot()
+        data['autosave_generation'] = self.generation
+        self.jobs.put(("checkpoint", self.generation, data))
+        return True
+
+    def run(self):
+        while True:
+            kind, generation, payload = self.jobs.get()
+            try:
+                if kind == "checkpoint":
+                    self.write_checkpoint(payload)
+                else:
+                    self.append_journal(generation, payload)
+            except Exception as e:
+                print(f"Auto-save failed: {e}")
+                self.reset()
+
+    def write_checkpoint(self, data):
+        directory = os.path.dirname(self.filepath)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = self.filepath + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.filepath)
+        # A journal left by a crash right here holds another generation and is ignored.
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def append_journal(self, generation, changes):
+        with open(self.journal_path, "a") as f:
+            for patch in changes:
+                f.write(json.dumps({'generation': generation, 'changes': patch}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def recover(filepath, data):
+        """Replays the journal of an autosave checkpoint onto its loaded data."""
+        generation = data.get('autosave_generation')
+        journal_path = os.path.splitext(filepath)[0] + ".journal"
+        if generation is None or not os.path.exists(journal_path): return data
+        collections = {'prisms': data.get('prisms', []), 'start_configs': data.get('start_configs', [])}
+        with open(journal_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break # Torn last line of a crash
+                if entry['generation'] != generation: continue
+                index = {}
+                def find(collection, item_id):
+                    if collection not in index:
+                        index[collection] = {x['id']: x for x in collections[collection]}
+                    return index[collection].get(item_id)
+                apply_changes(collections, entry['changes'], find)
+        return {**data, **collections}
+
 class AdvancedPrismEditor:
+    # --- LEVEL OF DETAIL ---
+    VIEW_MARGIN = 30      # Pixels drawn beyond the canvas edges
+    LABEL_MIN_ZOOM = 2.0  # Prism labels are hidden below this zoom
+    CLUSTER_PX = 10       # Screen size of the cells used to aggregate dense prisms
+    CLUSTER_MIN = 3       # Prisms in one cell drawn as a single cluster marker
+
+    # --- FRAME SCHEDULING ---
+    FRAME_MS = 16         # Shortest time between two redraws
+    # What changed since the last frame, a frame does the highest level requested.
+    REDRAW_VIEW = 1       # Pan or zoom: shift the items, then resync them
+    REDRAW_RENDER = 2     # Selection, ghost or cut: render the cached trace
+    REDRAW_TRACE = 3      # Prisms or lasers: draw_scene (retrace unless cached)
+
     def __init__(self, root):
         self.root = root
         self.root.title("Prism Editor PRO - Multi-Laser")
@@ -22,12 +581,28 @@ class AdvancedPrismEditor:
         self.next_start_id = 2
         self.active_start_idx = 0
         
-        self.prisms = []
+        self.prisms = prism.Scene()
         self.next_id = 1
         self.angle_tolerance = 0.01
         self.max_iterations = 1000
         self.attenuation_factor = 0.0
         self.attenuation_threshold = 0.01
+        self.trace_worker = TraceWorker()
+        self.trace_cache = prism.TraceCache()
+        self.auto_aim = prism.AutoAim()
+        self.spatial_index = SpatialIndex()
+        self.trace_request = 0 # Increases on every draw_scene
+        self.shown_request = 0 # Request the displayed results belong to
+        self.last_results = []
+        self.segment_boxes = {} # id(result) -> (its segments, bounding boxes as arrays)
+        self.last_show_ghost = False
+        self.trace_ms = None # Time of the trace on screen, None when it came from the cache
+        self.trace_poll_timer = None
+        self.frame_timer = None
+        self.frame_level = 0
+        self.frame_ghost = None # show_ghost of the latest request, None keeps the one on screen
+        self.view_delta = (1.0, 0.0, 0.0) # Pending (scale, dx, dy) of the items since the last frame
+        self.last_frame = 0.0
         
         # --- MOUSE INTERACTION STATE ---
         self.dragging_prism_idx = None
@@ -47,9 +622,8 @@ class AdvancedPrismEditor:
         self.clipboard_is_cut = False
 
         # --- HISTORY (UNDO/REDO) ---
-        self.history = []
-        self.history_index = -1
-        self.is_undoredo_op = False
+        self.history = UndoHistory(self)
+        self.autosaver = Autosaver(os.path.join("prisms_data", "autosave.json"))
         self.is_dragging = False
         self.cut_ids = []
         self.placing_laser = False
@@ -71,6 +645,8 @@ class AdvancedPrismEditor:
         self.auto_save_var = tk.BooleanVar(value=False)
         self.chk_auto_save = ttk.Checkbutton(self.toolbar, text="Auto-save", variable=self.auto_save_var, command=self.toggle_auto_save)
         self.chk_auto_save.pack(side=tk.LEFT, padx=5)
+        self.status_label = ttk.Label(self.toolbar, text="", foreground="gray")
+        self.status_label.pack(side=tk.RIGHT, padx=5)
 
         ttk.Button(self.toolbar, text="Save", command=self.save_state).pack(side=tk.LEFT, padx=5)
         ttk.Button(self.toolbar, text="Load", command=self.load_state).pack(side=tk.LEFT, padx=5)
@@ -79,6 +655,7 @@ class AdvancedPrismEditor:
         self.canvas = tk.Canvas(right_frame, bg="#f0f0f0", cursor="crosshair")
         self.canvas.pack(fill=tk.BOTH, expand=True)
         self.canvas.focus_set()
+        self.scene_items = RetainedScene(self.canvas)
 
         # --- PANEL SECTIONS ---
         self.create_position_mode_section()
@@ -96,6 +673,7 @@ class AdvancedPrismEditor:
         self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
         self.canvas.bind("<Button-4>", self.on_mouse_wheel)
         self.canvas.bind("<Button-5>", self.on_mouse_wheel)
+        self.canvas.bind("<Configure>", lambda event: self.request_frame(self.REDRAW_VIEW))
         
         # Shortcuts
         self.root.bind("<Control-z>", self.undo_action)
@@ -105,6 +683,13 @@ class AdvancedPrismEditor:
         self.root.bind("<Control-v>", self.paste_selection)
         self.root.bind("<Delete>", self.delete_selection)
         self.root.bind("<Escape>", self.clear_clipboard)
+        # Bulk moves of the selection, on the canvas so that entries keep their keys
+        self.canvas.bind("<Left>", lambda event: self.nudge_selection(dx=-1))
+        self.canvas.bind("<Right>", lambda event: self.nudge_selection(dx=1))
+        self.canvas.bind("<Up>", lambda event: self.nudge_selection(dy=1))
+        self.canvas.bind("<Down>", lambda event: self.nudge_selection(dy=-1))
+        self.canvas.bind("<bracketleft>", lambda event: self.nudge_selection(rotate=15))
+        self.canvas.bind("<bracketright>", lambda event: self.nudge_selection(rotate=-15))
         
         # Mac Support
         self.root.bind("<Command-z>", self.undo_action)
@@ -132,7 +717,7 @@ class AdvancedPrismEditor:
         f_laser_tree.pack(fill=tk.X, pady=2)
         
         cols = ("id", "x", "y", "ang")
-        self.laser_tree = ttk.Treeview(f_laser_tree, columns=cols, show="headings", height=4)
+        self.laser_tree = ttk.Treeview(f_laser_tree, columns=cols, show="headings", height=4, selectmode="browse")
         self.laser_tree.heading("id", text="ID")
         self.laser_tree.column("id", width=30, anchor="center")
         self.laser_tree.heading("x", text="X")
@@ -141,8 +726,11 @@ class AdvancedPrismEditor:
         self.laser_tree.column("y", width=55, anchor="center")
         self.laser_tree.heading("ang", text="Deg")
         self.laser_tree.column("ang", width=50, anchor="center")
-        self.laser_tree.pack(fill=tk.X, expand=True)
+        laser_scroll = ttk.Scrollbar(f_laser_tree, orient=tk.VERTICAL)
+        self.laser_tree.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        laser_scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.laser_tree.bind("<<TreeviewSelect>>", self.on_laser_select)
+        self.laser_list = VirtualList(self.laser_tree, laser_scroll, lambda: len(self.start_configs), self.laser_row, self.laser_index)
 
         f_laser_buttons = ttk.Frame(self.panel)
         f_laser_buttons.pack(fill=tk.X, pady=2)
@@ -311,18 +899,12 @@ class AdvancedPrismEditor:
 
             targets = []
             if self.selected_ids:
-                targets = [p for p in self.prisms if p['id'] in self.selected_ids]
+                targets = self.selected_ids
             elif self.last_placed_prism_id is not None:
-                targets = [p for p in self.prisms if p['id'] == self.last_placed_prism_id]
+                targets = [self.last_placed_prism_id]
                 self.last_placed_prism_id = None
             
-            for p in targets:
-                p['angle'] = new_angle
-                p['type'] = p_type
-                p['intensity_factor'] = new_intensity
-            
-            self.refresh_ui()
-            self.save_state_for_undo()
+            self.bulk_edit(targets, angle=new_angle, type=p_type, intensity_factor=new_intensity)
         except ValueError:
             messagebox.showerror("Invalid Input", "Values must be valid numbers.")
 
@@ -333,30 +915,32 @@ class AdvancedPrismEditor:
     def create_prism_list_section(self):
         ttk.Label(self.panel, text="PRISM LIST", font=("Arial", 10, "bold")).pack(pady=5)
         columns = ("id", "type", "x", "y", "ang", "factor")
-        self.tree = ttk.Treeview(self.panel, columns=columns, show="headings", height=10)
+        f_tree = ttk.Frame(self.panel)
+        f_tree.pack(fill=tk.BOTH, expand=True, pady=5)
+        self.tree = ttk.Treeview(f_tree, columns=columns, show="headings", height=10)
         self.tree.heading("id", text="ID"); self.tree.column("id", width=30, anchor="center")
         self.tree.heading("type", text="Type"); self.tree.column("type", width=60, anchor="center")
         self.tree.heading("x", text="X"); self.tree.column("x", width=45, anchor="center")
         self.tree.heading("y", text="Y"); self.tree.column("y", width=45, anchor="center")
         self.tree.heading("ang", text="Deg"); self.tree.column("ang", width=40, anchor="center")
         self.tree.heading("factor", text="Fac"); self.tree.column("factor", width=40, anchor="center")
-        self.tree.pack(fill=tk.BOTH, expand=True, pady=5)
+        scroll = ttk.Scrollbar(f_tree, orient=tk.VERTICAL)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scroll.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree.bind("<<TreeviewSelect>>", self.on_prism_select)
+        self.prism_list = VirtualList(self.tree, scroll, lambda: len(self.prisms), self.prism_row, lambda iid: self.prisms.rows.get(int(iid)))
         ttk.Separator(self.panel, orient='horizontal').pack(fill='x', pady=10)
 
     def on_prism_select(self, event):
-        selected_items = self.tree.selection()
-        if not selected_items: return
+        selected_items = self.prism_list.user_selection()
+        if selected_items is None: return
         
-        self.selected_ids = []
-        for item_id in selected_items:
-            # In Python 3, keys are strings.
-            values = self.tree.item(item_id)['values']
-            if values:
-                self.selected_ids.append(values[0])
+        # Ids in scene order, including the prisms selected outside the visible rows.
+        rows = self.prisms.rows
+        self.selected_ids = [pid for _, pid in sorted((rows[pid], pid) for pid in map(int, selected_items) if pid in rows)]
         
         if len(self.selected_ids) == 1:
-            p = next((p for p in self.prisms if p['id'] == self.selected_ids[0]), None)
+            p = self.prism_by_id(self.selected_ids[0])
             if p:
                 self.combo_prism_type.set(p.get('type', 'normal'))
                 self.on_prism_type_change()
@@ -369,10 +953,10 @@ class AdvancedPrismEditor:
         self.draw_scene()
 
     def on_laser_select(self, event):
-        selected_item = self.laser_tree.focus()
-        if not selected_item: return
+        selected_items = self.laser_list.user_selection()
+        if not selected_items: return
         
-        if selected_item:
+        for selected_item in selected_items:
             item_values = self.laser_tree.item(selected_item)['values']
             if item_values:
                 selected_id = item_values[0]
@@ -393,6 +977,7 @@ class AdvancedPrismEditor:
 
     def remove_laser(self):
         if len(self.start_configs) > 1:
+            self.history.deleting("start_configs", self.start_configs[self.active_start_idx], self.active_start_idx)
             self.start_configs.pop(self.active_start_idx)
             self.active_start_idx = min(self.active_start_idx, len(self.start_configs) - 1)
             self.refresh_ui()
@@ -405,31 +990,31 @@ class AdvancedPrismEditor:
         self.refresh_laser_tree()
 
     def refresh_prism_tree(self):
-        for item in self.tree.get_children(): self.tree.delete(item)
-        for p in self.prisms:
-            x_val = int(p['x']) if self.mode_var.get() == "GRID" else round(p['x'], 3)
-            y_val = int(p['y']) if self.mode_var.get() == "GRID" else round(p['y'], 3)
-            p_type = p.get('type', 'normal')
-            p_factor = p.get('intensity_factor', 1.0)
-            self.tree.insert("", tk.END, iid=str(p['id']), values=(p['id'], p_type, x_val, y_val, round(p['angle'], 3), p_factor))
-        
-        # Restore selection
-        if self.selected_ids:
-            # Filter IDs that actually exist in the tree
-            valid_ids = [str(pid) for pid in self.selected_ids if self.tree.exists(str(pid))]
-            if valid_ids:
-                self.tree.selection_set(valid_ids)
-                self.tree.see(valid_ids[0])
-            
+        # Only the visible rows are rebuilt; the selection follows the first selected prism.
+        first = str(self.selected_ids[0]) if self.selected_ids else None
+        self.prism_list.refresh({str(pid) for pid in self.selected_ids}, see=first)
+
+    def prism_row(self, i):
+        p = self.prisms[i]
+        x_val = int(p['x']) if self.mode_var.get() == "GRID" else round(p['x'], 3)
+        y_val = int(p['y']) if self.mode_var.get() == "GRID" else round(p['y'], 3)
+        p_type = p.get('type', 'normal')
+        p_factor = p.get('intensity_factor', 1.0)
+        return str(p['id']), (p['id'], p_type, x_val, y_val, round(p['angle'], 3), p_factor)
+
     def refresh_laser_tree(self):
-        for item in self.laser_tree.get_children(): self.laser_tree.delete(item)
-        for i, cfg in enumerate(self.start_configs):
-            x_val = int(cfg['x']) if self.mode_var.get() == "GRID" else round(cfg['x'], 3)
-            y_val = int(cfg['y']) if self.mode_var.get() == "GRID" else round(cfg['y'], 3)
-            item = self.laser_tree.insert("", tk.END, iid=str(cfg['id']), values=(cfg['id'], x_val, y_val, round(cfg['angle'], 3)))
-            if i == self.active_start_idx:
-                self.laser_tree.selection_set(item)
-                self.laser_tree.focus(item)
+        if not self.start_configs: return self.laser_list.refresh(set())
+        active = str(self.start_configs[self.active_start_idx]['id'])
+        self.laser_list.show(active, {active})
+
+    def laser_row(self, i):
+        cfg = self.start_configs[i]
+        x_val = int(cfg['x']) if self.mode_var.get() == "GRID" else round(cfg['x'], 3)
+        y_val = int(cfg['y']) if self.mode_var.get() == "GRID" else round(cfg['y'], 3)
+        return str(cfg['id']), (cfg['id'], x_val, y_val, round(cfg['angle'], 3))
+
+    def laser_index(self, iid):
+        return next((i for i, cfg in enumerate(self.start_configs) if str(cfg['id']) == iid), None)
 
     def get_snapped_coords(self, screen_x, screen_y):
         lx, ly = self.to_logical(screen_x, screen_y)
@@ -439,7 +1024,8 @@ class AdvancedPrismEditor:
 
     def copy_selection(self, event=None):
         if not self.selected_ids: return
-        self.clipboard = copy.deepcopy([p for p in self.prisms if p['id'] in self.selected_ids])
+        selected = set(self.selected_ids)
+        self.clipboard = [dict(p) for p in self.prisms if p['id'] in selected]
         if not self.clipboard: return
         self.clipboard_is_cut = False
         self.clipboard_center = (sum(p['x'] for p in self.clipboard)/len(self.clipboard), sum(p['y'] for p in self.clipboard)/len(self.clipboard))
@@ -473,15 +1059,15 @@ class AdvancedPrismEditor:
         if self.mode_var.get() == "GRID":
             delta_x, delta_y = round(delta_x / 10) * 10, round(delta_y / 10) * 10
 
-        self.selected_ids = []
-        for p in self.clipboard:
-            new_prism = {"id": self.next_id, "x": p['x'] + delta_x, "y": p['y'] + delta_y, "angle": p['angle']}
-            self.prisms.append(new_prism)
-            self.selected_ids.append(self.next_id)
-            self.next_id += 1
+        # Copies keep every field (type, intensity factor) and land in one extend.
+        pasted = [dict(p, id=self.next_id + k, x=p['x'] + delta_x, y=p['y'] + delta_y) for k, p in enumerate(self.clipboard)]
+        self.prisms.extend(pasted)
+        for p in pasted: self.history.inserted("prisms", p)
+        self.selected_ids = [p['id'] for p in pasted]
+        self.next_id += len(pasted)
         
         if self.clipboard_is_cut:
-            self.prisms = [p for p in self.prisms if p['id'] not in self.cut_ids]
+            self.delete_prisms(self.cut_ids)
             self.cut_ids = []
 
         if self.clipboard_is_cut: self.clipboard, self.clipboard_is_cut = [], False
@@ -490,44 +1076,64 @@ class AdvancedPrismEditor:
 
     def delete_selection(self, event=None):
         if not self.selected_ids: return
-        self.prisms = [p for p in self.prisms if p['id'] not in self.selected_ids]
+        self.delete_prisms(self.selected_ids)
         self.selected_ids = []
         self.save_state_for_undo()
         self.refresh_ui()
 
-    def get_active_shooter(self, exclude_ids=[]):
-        if not self.start_configs: return {'x':0,'y':0,'angle':0}, -1
-        active_start_cfg = self.start_configs[self.active_start_idx]
-        temp_prisms = [p for p in self.prisms if p['id'] not in exclude_ids]
-        try:
-            seq, _, _, _ = prism.calculate_path(active_start_cfg, temp_prisms, self.angle_tolerance, self.max_iterations)
-        except RuntimeError:
-            return active_start_cfg, -1
-        
-        if not seq: return active_start_cfg, -1
-        
-        last_hit_id = seq[-1]
-        shooter = next((p for p in self.prisms if p['id'] == last_hit_id), None)
-        return (shooter, self.prisms.index(shooter)) if shooter else (active_start_cfg, -1)
+    def delete_prisms(self, ids):
+        for pid in ids:
+            row = self.prisms.rows.get(pid)
+            if row is not None: self.history.deleting("prisms", self.prisms[row], row)
+        self.prisms.delete(ids)
+
+    def bulk_edit(self, ids, dx=0.0, dy=0.0, rotate=0.0, scale=1.0, **fields):
+        """
+        Edits many prisms in one vectorized pass over the scene columns: scales and
+        rotates them about their centroid, translates them, then assigns fields
+        (angle, type, intensity_factor). One undo entry and one retrace, whatever the count.
+        In GRID mode only the translation snaps to the grid: snapping rotated or scaled
+        coordinates would distort the block, so they keep 3 decimals as in FREE mode.
+        """
+        rows = self.prisms.rows_of(ids)
+        if not len(rows): return
+        for p in self.prisms.to_list(rows): self.history.changing("prisms", p)
+        if dx or dy or rotate or scale != 1.0:
+            if self.mode_var.get() == "GRID":
+                dx, dy = round(dx / 10) * 10, round(dy / 10) * 10
+            self.prisms.transform(rows, dx, dy, rotate, scale, snap=lambda v: np.round(v, 3))
+        if fields:
+            self.prisms.assign(rows, **fields)
+        self.save_state_for_undo()
+        self.refresh_ui()
 
-    def calculate_angle_for_shooter(self, shooter, shooter_idx, target_x, target_y):
-        dx, dy = target_x - shooter['x'], target_y - shooter['y']
-        desired_abs_angle = math.degrees(math.atan2(dy, dx))
-        
-        if shooter_idx == -1: return desired_abs_angle
+    def nudge_selection(self, dx=0.0, dy=0.0, rotate=0.0):
+        if not self.selected_ids: return
+        step = 10 if self.mode_var.get() == "GRID" else 1
+        self.bulk_edit(self.selected_ids, dx * step, dy * step, rotate)
+        return "break"
 
+    def prism_by_id(self, pid):
+        return self.prisms.by_id(pid)
+
+    def aim_active_shooter(self, target_x, target_y, exclude_ids=()):
+        """Returns the shooter of the active laser (the laser or its last prism) and the angle aiming it at the target."""
+        if not self.start_configs: return {'x':0,'y':0,'angle':0}, 0.0
         active_start_cfg = self.start_configs[self.active_start_idx]
-        incoming_angle = active_start_cfg['angle']
         try:
-            seq, _, _, _ = prism.calculate_path(active_start_cfg, self.prisms, self.angle_tolerance, self.max_iterations)
-            if shooter['id'] in seq:
-                prisms_before = seq[:seq.index(shooter['id'])]
-                for pid in prisms_before:
-                    p = next(p for p in self.prisms if p['id'] == pid)
-                    incoming_angle += p['angle']
-        except: pass
-        deviation = desired_abs_angle - incoming_angle
-        return (deviation + 180) % 360 - 180
+            shooter, _, new_angle = self.auto_aim.aim(active_start_cfg, self.prisms, target_x, target_y, self.angle_tolerance, self.max_iterations, exclude_ids)
+        except RuntimeError:
+            return active_start_cfg, math.degrees(math.atan2(target_y - active_start_cfg['y'], target_x - active_start_cfg['x']))
+        return (shooter if shooter is not None else active_start_cfg), new_angle
+
+    def aim_at(self, target_x, target_y, exclude_ids=()):
+        """Auto-aim: turns the shooter of the active laser towards the target."""
+        if not self.start_configs: return
+        shooter, new_angle = self.aim_active_shooter(target_x, target_y, exclude_ids)
+        is_laser = shooter is self.start_configs[self.active_start_idx]
+        self.history.changing("start_configs" if is_laser else "prisms", shooter)
+        shooter['angle'] = new_angle
+        if is_laser: self.refresh_laser_tree()
 
     def on_mouse_down(self, event):
         self.cancel_cut()
@@ -538,14 +1144,12 @@ class AdvancedPrismEditor:
         if self.placing_laser:
             new_id = self.next_start_id
             self.start_configs.append({'x': lx, 'y': ly, 'angle': 0, 'id': new_id})
+            self.history.inserted("start_configs", self.start_configs[-1])
             self.next_start_id += 1
             self.active_start_idx = len(self.start_configs) - 1
             self.cancel_placing_laser()
             self.refresh_ui()
             self.save_state_for_undo()
-            self.laser_tree.see(str(new_id))
-            self.laser_tree.selection_set(str(new_id))
-            self.laser_tree.focus(str(new_id))
             return
         
         # Check for dragging start point
@@ -553,21 +1157,22 @@ class AdvancedPrismEditor:
             if math.sqrt((cfg['x'] - lx)**2 + (cfg['y'] - ly)**2) < (5 if self.mode_var.get() == "GRID" else 3):
                 self.dragging_start_idx = i
                 self.is_dragging = True
+                self.history.changing("start_configs", cfg)
                 self.selected_ids = []
                 self.draw_scene()
                 return
 
         # Check for dragging prism
-        for i, p in enumerate(self.prisms):
-            if math.sqrt((p['x']-lx)**2 + (p['y']-ly)**2) < (5 if self.mode_var.get() == "GRID" else 3):
-                self.dragging_prism_idx = i
-                self.is_dragging = True
-                self.selected_ids = [p['id']]
-                self.tree.selection_set(str(p['id']))
-                self.tree.focus(str(p['id']))
-                self.tree.see(str(p['id']))
-                self.draw_scene()
-                return
+        i = self.spatial_index.pick(self.prisms, lx, ly, 5 if self.mode_var.get() == "GRID" else 3)
+        if i is not None:
+            p = self.prisms[i]
+            self.dragging_prism_idx = i
+            self.is_dragging = True
+            self.history.changing("prisms", p)
+            self.selected_ids = [p['id']]
+            self.prism_list.show(str(p['id']), {str(p['id'])})
+            self.draw_scene()
+            return
 
         self.selecting, self.selection_start, self.selected_ids = True, (event.x, event.y), []
         if self.selection_rect: self.canvas.delete(self.selection_rect)
@@ -582,13 +1187,12 @@ class AdvancedPrismEditor:
             self.prisms[self.dragging_prism_idx]['x'], self.prisms[self.dragging_prism_idx]['y'] = lx, ly
             if self.auto_aim_var.get():
                 dragged_id = self.prisms[self.dragging_prism_idx]['id']
-                shooter, shooter_idx = self.get_active_shooter(exclude_ids=[dragged_id])
-                new_angle = self.calculate_angle_for_shooter(shooter, shooter_idx, lx, ly)
-                shooter['angle'] = new_angle
-                if shooter_idx == -1: self.refresh_laser_tree()
+                self.aim_at(lx, ly, exclude_ids=[dragged_id])
         elif self.selecting:
+            # The rubber band is not part of the scene, nothing to redraw.
             self.canvas.coords(self.selection_rect, self.selection_start[0], self.selection_start[1], event.x, event.y)
-        self.draw_scene()
+            return
+        self.request_frame(self.REDRAW_TRACE, show_ghost=False)
 
     def on_mouse_up(self, event):
         need_refresh = False
@@ -611,10 +1215,8 @@ class AdvancedPrismEditor:
     def finalize_selection(self, x1, y1, x2, y2):
         rx1, rx2 = sorted([x1, x2]); ry1, ry2 = sorted([y1, y2])
         lx1, ly1 = self.to_logical(rx1, ry1); lx2, ly2 = self.to_logical(rx2, ry2)
-        self.selected_ids = [p['id'] for p in self.prisms if min(lx1,lx2) <= p['x'] <= max(lx1,lx2) and min(ly1,ly2) <= p['y'] <= max(ly1,ly2)]
-        self.tree.selection_set([str(pid) for pid in self.selected_ids])
-        if self.selected_ids:
-            self.tree.see(str(self.selected_ids[0]))
+        self.selected_ids = [self.prisms.id[row] for row in self.spatial_index.rect(self.prisms, lx1, ly1, lx2, ly2)]
+        self.refresh_prism_tree()
         self.draw_scene()
 
     def create_new_prism(self, screen_x, screen_y):
@@ -625,10 +1227,7 @@ class AdvancedPrismEditor:
             angle = 0.0
         
         if self.auto_aim_var.get():
-            shooter, shooter_idx = self.get_active_shooter()
-            new_angle = self.calculate_angle_for_shooter(shooter, shooter_idx, lx, ly)
-            shooter['angle'] = new_angle
-            if shooter_idx == -1: self.refresh_laser_tree()
+            self.aim_at(lx, ly)
 
         p_type = self.combo_prism_type.get()
         try:
@@ -643,6 +1242,7 @@ class AdvancedPrismEditor:
             "type": p_type,
             "intensity_factor": p_intensity
         })
+        self.history.inserted("prisms", self.prisms[-1])
         self.last_placed_prism_id = self.next_id
         newly_added_prism_id = self.next_id # Store the ID for scrolling
         
@@ -652,14 +1252,12 @@ class AdvancedPrismEditor:
         self.refresh_ui()
 
         # Scroll to the newly added prism
-        self.tree.see(str(newly_added_prism_id))
-        self.tree.selection_set(str(newly_added_prism_id))
-        self.tree.focus(str(newly_added_prism_id))
+        self.prism_list.show(str(newly_added_prism_id), {str(newly_added_prism_id)})
 
     def on_mouse_move(self, event):
         self.ghost_cursor_pos = (event.x, event.y)
         if self.placing_laser or self.clipboard or (self.dragging_prism_idx is None and self.dragging_start_idx is None and not self.selecting):
-            self.draw_scene(show_ghost=True)
+            self.request_frame(self.REDRAW_RENDER, show_ghost=True)
 
     def start_pan(self, event):
         self.last_mouse_x = event.x
@@ -670,11 +1268,11 @@ class AdvancedPrismEditor:
             lx, ly = self.get_snapped_coords(*self.ghost_cursor_pos)
             sx, sy = self.to_screen(lx, ly)
             
-            self.canvas.create_oval(sx-5, sy-5, sx+5, sy+5, fill="gray", dash=(2,2), tags="scene")
+            self.canvas.create_oval(sx-5, sy-5, sx+5, sy+5, fill="gray", dash=(2,2), tags=("scene", "ghost"))
             
             rad = math.radians(0) # Default angle
             ex, ey = sx + 20 * math.cos(rad), sy - 20 * math.sin(rad)
-            self.canvas.create_line(sx, sy, ex, ey, arrow=tk.LAST, fill="gray", width=2, dash=(2,2), tags="scene")
+            self.canvas.create_line(sx, sy, ex, ey, arrow=tk.LAST, fill="gray", width=2, dash=(2,2), tags=("scene", "ghost"))
 
     def pan_view(self, event):
         dx = event.x - self.last_mouse_x
@@ -683,11 +1281,14 @@ class AdvancedPrismEditor:
         self.offset_y += dy
         self.last_mouse_x = event.x
         self.last_mouse_y = event.y
-        self.draw_grid()
-        self.draw_scene()
+        # Panning is view-only: the next frame shifts the existing items, no retrace.
+        scale, tx, ty = self.view_delta
+        self.view_delta = (scale, tx + dx, ty + dy)
+        self.request_frame(self.REDRAW_VIEW)
 
     def on_mouse_wheel(self, event):
         lx_before, ly_before = self.to_logical(event.x, event.y)
+        zoom_before = self.zoom
         
         if event.num == 4 or event.delta > 0:
             self.zoom *= 1.1
@@ -699,12 +1300,90 @@ class AdvancedPrismEditor:
         self.offset_x += (lx_after - lx_before) * self.zoom
         self.offset_y -= (ly_after - ly_before) * self.zoom
 
+        # Zooming about the cursor is a uniform scale of screen coordinates, composed
+        # with the pending pans and zooms so a burst of events costs one frame.
+        factor = self.zoom / zoom_before
+        scale, tx, ty = self.view_delta
+        self.view_delta = (scale * factor, event.x + (tx - event.x) * factor, event.y + (ty - event.y) * factor)
+        self.request_frame(self.REDRAW_VIEW)
+
+    def request_frame(self, level, show_ghost=None):
+        """Marks the scene dirty, it is redrawn at most once per FRAME_MS whatever the event rate."""
+        self.frame_level = max(self.frame_level, level)
+        if show_ghost is not None: self.frame_ghost = show_ghost
+        if self.frame_timer is None:
+            wait = int((self.last_frame - time.perf_counter()) * 1000) + self.FRAME_MS
+            self.frame_timer = self.root.after(wait, self.draw_frame) if wait > 0 else self.root.after_idle(self.draw_frame)
+
+    def draw_frame(self):
+        self.frame_timer = None
+        self.last_frame = time.perf_counter()
+        show_ghost = self.last_show_ghost if self.frame_ghost is None else self.frame_ghost
+        self.frame_ghost = None
+        if self.frame_level >= self.REDRAW_TRACE:
+            self.draw_scene(show_ghost)
+        elif self.frame_level:
+            # Markers and labels have a fixed pixel size, so a pan or zoom still needs a
+            # render; most items already sit at their new place and are not touched.
+            self.render_scene(show_ghost)
+
+    def apply_view_delta(self):
+        """Shifts the items by the pans and zooms done since they were last drawn."""
+        scale, dx, dy = self.view_delta
+        if (scale, dx, dy) == (1.0, 0.0, 0.0): return
+        self.view_delta = (1.0, 0.0, 0.0)
         self.draw_grid()
-        self.draw_scene()
+        if scale != 1.0: self.scene_items.scale(0, 0, scale)
+        self.scene_items.move(dx, dy)
 
     def to_screen(self, lx, ly): return self.offset_x + lx * self.zoom, self.offset_y - ly * self.zoom
     def to_logical(self, sx, sy): return (sx - self.offset_x) / self.zoom, (self.offset_y - sy) / self.zoom
 
+    def visible_rect(self):
+        """Logical (x1, y1, x2, y2) of the canvas plus VIEW_MARGIN, or None before it is mapped."""
+        w, h = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if w <= 1 or h <= 1: return None
+        x1, y1 = self.to_logical(-self.VIEW_MARGIN, h + self.VIEW_MARGIN)
+        x2, y2 = self.to_logical(w + self.VIEW_MARGIN, -self.VIEW_MARGIN)
+        return x1, y1, x2, y2
+
+    @staticmethod
+    def in_view(view, x1, y1, x2=None, y2=None):
+        if view is None: return True
+        if x2 is None: x2, y2 = x1, y1
+        return min(x1, x2) <= view[2] and max(x1, x2) >= view[0] and min(y1, y2) <= view[3] and max(y1, y2) >= view[1]
+
+    @staticmethod
+    def merge_collinear(runs):
+        """
+        Joins (k, x1, y1, x2, y2, color) runs, k being the segment index, that follow
+        each other (k, k + 1...) and continue each other in a straight line.
+        """
+        merged = []
+        for k, x1, y1, x2, y2, color in runs:
+            if merged:
+                last = merged[-1]
+                _, mx1, my1, mx2, my2, mcolor, mk = last
+                if mk == k - 1 and (mx2, my2) == (x1, y1) and mcolor == color:
+                    ax, ay, bx, by = mx2 - mx1, my2 - my1, x2 - x1, y2 - y1
+                    if ax*bx + ay*by > 0 and abs(ax*by - ay*bx) <= 1e-9 * math.hypot(ax, ay) * math.hypot(bx, by):
+                        last[3], last[4], last[6] = x2, y2, k
+                        continue
+            merged.append([k, x1, y1, x2, y2, color, k])
+        return merged
+
+    def visible_segments(self, res, view):
+        """Indices of the segments of a result that cross view, from bounding boxes cached per result."""
+        segments = res["segments"]
+        if view is None or not segments: return range(len(segments))
+        boxes = self.segment_boxes.get(id(res))
+        if boxes is None or boxes[0] is not segments:
+            s = np.array([seg[:4] for seg in segments], dtype=np.float64)
+            boxes = self.segment_boxes[id(res)] = (segments, np.minimum(s[:, 0], s[:, 2]), np.maximum(s[:, 0], s[:, 2]),
+                                                   np.minimum(s[:, 1], s[:, 3]), np.maximum(s[:, 1], s[:, 3]))
+        _, xmin, xmax, ymin, ymax = boxes
+        return np.flatnonzero((xmin <= view[2]) & (xmax >= view[0]) & (ymin <= view[3]) & (ymax >= view[1])).tolist()
+
     def draw_grid(self):
         self.canvas.delete("grid")
         ox, oy = self.to_screen(0, 0)
@@ -712,50 +1391,107 @@ class AdvancedPrismEditor:
         self.canvas.create_line(ox, 0, ox, 2000, fill="#ddd", width=2, tags="grid")
 
     def draw_scene(self, show_ghost=False):
-        self.canvas.delete("scene")
-        results = prism.calculate_all_paths(
-            self.start_configs, self.prisms, self.angle_tolerance, self.max_iterations,
-            self.attenuation_factor, self.attenuation_threshold
-        )
+        self.frame_level = 0 # Covers any pending frame
+        params = (self.angle_tolerance, self.max_iterations, self.attenuation_factor, self.attenuation_threshold)
+        key = prism.scene_fingerprint(self.start_configs, self.prisms, *params)
+        self.trace_request += 1
+        cached = self.trace_cache.get(key)
+        if cached is not None:
+            # Unchanged scene (selection, ghost moves, undo to a seen state): no trace.
+            self.last_results, self.shown_request = cached, self.trace_request
+            self.trace_ms = None
+        else:
+            self.trace_worker.submit(key, (self.trace_request, key), self.start_configs, self.prisms, *params)
+            if self.trace_poll_timer is None:
+                self.trace_poll_timer = self.root.after(15, self.poll_trace_results)
+        self.render_scene(show_ghost)
+
+    def poll_trace_results(self):
+        finished = self.trace_worker.poll()
+        if finished:
+            (request, key), results, trace_seconds = finished
+            self.trace_cache.put(key, results)
+            # Skip results older than what is on screen, e.g. after a cache hit.
+            if request > self.shown_request:
+                self.last_results, self.shown_request = results, request
+                self.trace_ms = trace_seconds * 1000
+                self.render_scene(self.last_show_ghost)
+        if self.trace_worker.idle():
+            self.trace_poll_timer = None
+        else:
+            self.trace_poll_timer = self.root.after(15, self.poll_trace_results)
+
+    def render_scene(self, show_ghost=False):
+        # Paths come from the latest finished trace, which may lag behind the edits.
+        t0 = time.perf_counter()
+        self.apply_view_delta()
+        if self.frame_level < self.REDRAW_TRACE: self.frame_level = 0
+        self.last_show_ghost = show_ghost
+        results = self.last_results[:len(self.start_configs)]
+        if self.segment_boxes and not any(id(res) in self.segment_boxes for res in results):
+            self.segment_boxes = {} # New trace on screen
+        put = self.scene_items.put
+        self.scene_items.begin()
 
         error_messages = []
         bg_color = self.canvas.cget("bg")
+        view = self.visible_rect()
         for i, res in enumerate(results):
             if res['error']:
                 error_messages.append(f"⚠️ LASER {self.start_configs[i]['id']}: {res['error']}")
+            if res['truncated']:
+                error_messages.append(f"✂️ LASER {self.start_configs[i]['id']}: truncated ({', '.join(res['truncated'])})")
+            if res['loop_info']:
+                info = res['loop_info']
+                laps = "never decays" if info['cycles'] is None else f"{info['cycles']} laps above threshold"
+                error_messages.append(f"🔁 LASER {self.start_configs[i]['id']}: loop of {info['hops']} hops, gain {info['gain']:.3g} per lap, {laps}")
 
             base_color = "#00aa00" if i == self.active_start_idx else "#88ff88"
             
             if "segments" in res:
-                for seg in res["segments"]:
-                    x1, y1, x2, y2, i1, i2 = seg
+                segments = res["segments"]
+                runs = []
+                # Culled before any colour or merge work, so off-screen paths cost nothing.
+                for k in self.visible_segments(res, view):
+                    x1, y1, x2, y2, i1, i2 = segments[k]
                     avg_intensity = (i1 + i2) / 2.0
-                    color = self.interpolate_color(base_color, bg_color, avg_intensity)
+                    runs.append((k, x1, y1, x2, y2, self.interpolate_color(base_color, bg_color, avg_intensity)))
+                # Straight chains become one line, keyed by their first visible segment.
+                for k, x1, y1, x2, y2, color, _ in self.merge_collinear(runs):
                     sx1, sy1 = self.to_screen(x1, y1)
                     sx2, sy2 = self.to_screen(x2, y2)
-                    self.canvas.create_line(round(sx1), round(sy1), round(sx2), round(sy2), fill=color, width=2, tags="scene")
+                    put(("seg", i, k), "line", [round(sx1), round(sy1), round(sx2), round(sy2)], "paths", fill=color, width=2)
 
             if res.get('loop_coords'):
-                loop_path = res['loop_coords']
-                loop_path.append(loop_path[0])
-                if len(loop_path) >= 2:
-                    flat_coords = [c for p in loop_path for c in self.to_screen(*p)]
-                    # Use a simple, intense red for loops that might have low intensity
-                    self.canvas.create_line(round(flat_coords[0]), round(flat_coords[1]), round(flat_coords[2]), round(flat_coords[3]), fill="red", width=2, tags="scene")
-                    for i in range(1, len(loop_path) - 1):
-                         sx1, sy1 = self.to_screen(*loop_path[i])
-                         sx2, sy2 = self.to_screen(*loop_path[i+1])
-                         self.canvas.create_line(round(sx1), round(sy1), round(sx2), round(sy2), fill="red", width=2, tags="scene")
+                loop_path = res['loop_coords'] + [res['loop_coords'][0]] # Results may be reused, don't mutate
+                # Use a simple, intense red for loops that might have low intensity
+                for k in range(len(loop_path) - 1):
+                    if not self.in_view(view, *loop_path[k], *loop_path[k+1]): continue
+                    sx1, sy1 = self.to_screen(*loop_path[k])
+                    sx2, sy2 = self.to_screen(*loop_path[k+1])
+                    put(("loop", i, k), "line", [round(sx1), round(sy1), round(sx2), round(sy2)], "paths", fill="red", width=2)
 
         for i, msg in enumerate(error_messages):
-            self.canvas.create_text(10, 10 + i*20, anchor="nw", text=msg, fill="red", font=("Arial", 14, "bold"), tags="scene")
+            put(("error", i), "text", [10, 10 + i*20], "paths", anchor="nw", text=msg, fill="red", font=("Arial", 14, "bold"))
 
+        self.draw_prisms(view)
+        self.draw_start_points(view)
+        self.scene_items.end()
+
+        # Ghost previews follow the cursor and are few, they are simply redrawn.
+        self.canvas.delete("ghost")
         self.draw_ghost_paste()
         self.draw_ghost_ray(show_ghost, results)
         if show_ghost:
             self.draw_ghost_laser()
-        self.draw_prisms()
-        self.draw_start_points()
+        self.canvas.tag_raise("prisms")
+        self.canvas.tag_raise("lasers")
+        self.show_frame_stats((time.perf_counter() - t0) * 1000)
+
+    def show_frame_stats(self, render_ms):
+        trace = "cached" if self.trace_ms is None else f"{self.trace_ms:.1f} ms"
+        pending = "" if self.shown_request == self.trace_request else " (tracing...)"
+        self.status_label.config(text=f"Trace {trace}{pending} | Render {render_ms:.1f} ms | {len(self.scene_items.items)} items")
 
     def interpolate_color(self, color_hex, bg_hex, intensity):
         try:
@@ -780,62 +1516,96 @@ class AdvancedPrismEditor:
             for p in self.clipboard:
                 sx, sy = self.to_screen(p['x']+delta_x, p['y']+delta_y)
                 r = 6 if self.mode_var.get() == "GRID" else 5
-                self.canvas.create_rectangle(sx-r, sy-r, sx+r, sy+r, outline="gray", dash=(2,2), tags="scene") if self.mode_var.get() == "GRID" else self.canvas.create_oval(sx-r, sy-r, sx+r, sy+r, outline="gray", dash=(2,2), tags="scene")
+                self.canvas.create_rectangle(sx-r, sy-r, sx+r, sy+r, outline="gray", dash=(2,2), tags=("scene", "ghost")) if self.mode_var.get() == "GRID" else self.canvas.create_oval(sx-r, sy-r, sx+r, sy+r, outline="gray", dash=(2,2), tags=("scene", "ghost"))
 
     def draw_ghost_ray(self, show_ghost, results):
         if show_ghost and all(not r['error'] for r in results):
-            shooter, _ = self.get_active_shooter()
-            sx_anchor, sy_anchor = self.to_screen(shooter['x'], shooter['y'])
             lx_snap, ly_snap = self.get_snapped_coords(*self.ghost_cursor_pos)
+            shooter, _ = self.aim_active_shooter(lx_snap, ly_snap)
+            sx_anchor, sy_anchor = self.to_screen(shooter['x'], shooter['y'])
             sx_snap, sy_snap = self.to_screen(lx_snap, ly_snap)
-            self.canvas.create_line(round(sx_anchor), round(sy_anchor), round(sx_snap), round(sy_snap), fill="#888", dash=(4, 4), tags="scene")
+            self.canvas.create_line(round(sx_anchor), round(sy_anchor), round(sx_snap), round(sy_snap), fill="#888", dash=(4, 4), tags=("scene", "ghost"))
             if self.auto_aim_var.get():
-                self.canvas.create_oval(sx_anchor-4, sy_anchor-4, sx_anchor+4, sy_anchor+4, outline="magenta", width=2, tags="scene")
-
-    def draw_prisms(self):
-        for p in self.prisms:
-            sx, sy = self.to_screen(p['x'], p['y'])
-            p_type = p.get('type', 'normal')
-            p_factor = p.get('intensity_factor', 1.0)
-            
-            color = "blue" if self.mode_var.get() == "GRID" else "orange"
-            fill_color, dash_style = color, ()
-            if p['id'] in self.cut_ids: fill_color, dash_style = "", (4, 4)
-            elif p['id'] in self.selected_ids: fill_color = "violet"
-            
-            # Special colors for types
-            outline_color = "black"
-            if p_type == "splitter": outline_color = "cyan"
-            elif p_type == "combiner": outline_color = "yellow"
-            elif p_type == "reducer": outline_color = "brown"
-            elif p_type == "amplifier": outline_color = "white"
-
-            r = 6 if self.mode_var.get() == "GRID" else 5
-            self.canvas.create_rectangle(sx-r, sy-r, sx+r, sy+r, fill=fill_color, outline=outline_color, width=2 if p_type != "normal" else 1, tags="scene", dash=dash_style) if self.mode_var.get() == "GRID" else self.canvas.create_oval(sx-r, sy-r, sx+r, sy+r, fill=fill_color, outline=outline_color, width=2 if p_type != "normal" else 1, tags="scene", dash=dash_style)
-            
-            label = f"{p['id']}"
-            if p_type != "normal":
-                label += f" ({p_type[0].upper()}:{p_factor})"
-            self.canvas.create_text(sx, sy-15, text=label, font=("Arial", 8, "bold"), tags="scene")
+                self.canvas.create_oval(sx_anchor-4, sy_anchor-4, sx_anchor+4, sy_anchor+4, outline="magenta", width=2, tags=("scene", "ghost"))
+
+    def draw_prisms(self, view=None):
+        show_labels = self.zoom >= self.LABEL_MIN_ZOOM
+        cell = self.CLUSTER_PX / self.zoom
+        cells = {}
+        cut, selected = set(self.cut_ids), set(self.selected_ids)
+        marked = cut | selected
+        scene = self.prisms
+        xs, ys, ids = scene.x, scene.y, scene.id
+        # Only the rows in view are visited, found through the spatial index.
+        rows = range(len(scene)) if view is None else self.spatial_index.rect(scene, *view)
+        for row in rows:
+            x, y, pid = xs[row], ys[row], ids[row]
+            p = scene[row]
+            if pid in marked:
+                self.draw_prism(p, show_labels, cut, selected) # Never hide marked prisms in a cluster
+                continue
+            cells.setdefault((math.floor(x / cell), math.floor(y / cell)), []).append(p)
+
+        color = "blue" if self.mode_var.get() == "GRID" else "orange"
+        for (cx, cy), members in cells.items():
+            if len(members) < self.CLUSTER_MIN:
+                for p in members: self.draw_prism(p, show_labels, cut, selected)
+                continue
+            # Dense cluster: one marker covering the cell instead of overlapping prisms.
+            sx, sy = self.to_screen((cx + 0.5) * cell, (cy + 0.5) * cell)
+            r = self.CLUSTER_PX / 2
+            self.scene_items.put(("cluster", cx, cy, cell), "rectangle", [sx-r, sy-r, sx+r, sy+r], "prisms", fill=color, outline="black", width=2)
+
+    def draw_prism(self, p, show_label=True, cut=None, selected=None):
+        """Draws one prism; cut and selected are id sets (built from cut_ids and selected_ids if omitted)."""
+        if cut is None: cut, selected = set(self.cut_ids), set(self.selected_ids)
+        pid = p['id']
+        sx, sy = self.to_screen(p['x'], p['y'])
+        p_type = p.get('type', 'normal')
+        p_factor = p.get('intensity_factor', 1.0)
+        
+        color = "blue" if self.mode_var.get() == "GRID" else "orange"
+        fill_color, dash_style = color, ()
+        if pid in cut: fill_color, dash_style = "", (4, 4)
+        elif pid in selected: fill_color = "violet"
+        
+        # Special colors for types
+        outline_color = "black"
+        if p_type == "splitter": outline_color = "cyan"
+        elif p_type == "combiner": outline_color = "yellow"
+        elif p_type == "reducer": outline_color = "brown"
+        elif p_type == "amplifier": outline_color = "white"
+
+        r = 6 if self.mode_var.get() == "GRID" else 5
+        shape = "rectangle" if self.mode_var.get() == "GRID" else "oval"
+        self.scene_items.put(("prism", pid), shape, [sx-r, sy-r, sx+r, sy+r], "prisms", fill=fill_color, outline=outline_color, width=2 if p_type != "normal" else 1, dash=dash_style)
+        
+        if not show_label: return
+        label = f"{pid}"
+        if p_type != "normal":
+            label += f" ({p_type[0].upper()}:{p_factor})"
+        self.scene_items.put(("prism_label", pid), "text", [sx, sy-15], "prisms", text=label, font=("Arial", 8, "bold"))
 
-    def draw_start_points(self):
+    def draw_start_points(self, view=None):
         for i, cfg in enumerate(self.start_configs):
+            if not self.in_view(view, cfg['x'], cfg['y']): continue
             sx, sy = self.to_screen(cfg['x'], cfg['y'])
             fill_color = "red" if i == self.active_start_idx else "pink"
-            self.canvas.create_oval(sx-5, sy-5, sx+5, sy+5, fill=fill_color, tags="scene")
+            self.scene_items.put(("laser", cfg['id']), "oval", [sx-5, sy-5, sx+5, sy+5], "lasers", fill=fill_color)
             rad = math.radians(cfg['angle'])
             ex, ey = sx + 20 * math.cos(rad), sy - 20 * math.sin(rad)
-            self.canvas.create_line(round(sx), round(sy), round(ex), round(ey), arrow=tk.LAST, fill=fill_color, width=2, tags="scene")
-            self.canvas.create_text(sx, sy+15, text=f"L{cfg['id']}", font=("Arial", 8, "bold"), fill="red", tags="scene")
+            self.scene_items.put(("laser_arrow", cfg['id']), "line", [round(sx), round(sy), round(ex), round(ey)], "lasers", arrow=tk.LAST, fill=fill_color, width=2)
+            self.scene_items.put(("laser_label", cfg['id']), "text", [sx, sy+15], "lasers", text=f"L{cfg['id']}", font=("Arial", 8, "bold"), fill="red")
 
     def clear_all(self):
-        self.prisms, self.start_configs = [], [{'x': 0, 'y': 0, 'angle': 0, 'id': 1}]
+        self.history.replacing("prisms"); self.history.replacing("start_configs")
+        self.prisms, self.start_configs = prism.Scene(), [{'x': 0, 'y': 0, 'angle': 0, 'id': 1}]
         self.next_id, self.next_start_id, self.active_start_idx, self.selected_ids = 1, 2, 0, []
         self.refresh_ui(); self.save_state_for_undo()
 
     def save_state(self):
         data = {
-            'prisms': self.prisms, 
+            'prisms': self.prisms.to_list(), 
             'start_configs': self.start_configs,
             'angle_tolerance': self.angle_tolerance,
             'max_iterations': self.max_iterations,
@@ -848,7 +1618,7 @@ class AdvancedPrismEditor:
         filepath = filedialog.asksaveasfilename(
             initialdir="prisms_data", 
             defaultextension=".json", 
-            filetypes=[("JSON", "*.json")], 
+            filetypes=[("JSON", "*.json"), ("Prism scene", "*.prism")], 
             title="Save State",
             initialfile=default_filename
         )
@@ -856,15 +1626,26 @@ class AdvancedPrismEditor:
         if filepath:
             if not os.path.exists("prisms_data"):
                 os.makedirs("prisms_data")
-            with open(filepath, "w") as f:
-                json.dump(data, f, indent=2)
+            if filepath.endswith(".prism"):
+                prism.save_scene(filepath, self.prisms, self.start_configs, **{k: v for k, v in data.items() if k not in ('prisms', 'start_configs')})
+            else:
+                with open(filepath, "w") as f:
+                    json.dump(data, f, indent=2)
             messagebox.showinfo("Saved", f"State saved to {filepath}")
 
     def load_state(self):
-        filepath = filedialog.askopenfilename(initialdir="prisms_data", defaultextension=".json", filetypes=[("JSON", "*.json")], title="Load State")
+        filepath = filedialog.askopenfilename(initialdir="prisms_data", defaultextension=".json", filetypes=[("JSON", "*.json"), ("Prism scene", "*.prism")], title="Load State")
         if filepath:
-            with open(filepath, "r") as f: data = json.load(f)
-            self.prisms = data.get('prisms', [])
+            if prism.is_scene_file(filepath):
+                data = prism.load_scene(filepath)
+                data['prisms'] = prism.Scene.from_records(data['prisms'], data['types'])
+                data['start_configs'] = prism.scene_records(data['start_configs'])
+            else:
+                with open(filepath, "r") as f: data = json.load(f)
+                data = Autosaver.recover(filepath, data)
+            self.history.replacing("prisms"); self.history.replacing("start_configs")
+            prisms = data.get('prisms', [])
+            self.prisms = prisms if isinstance(prisms, prism.Scene) else prism.Scene(prisms)
             self.start_configs = data.get('start_configs', [{'x':0,'y':0,'angle':0,'id':1}])
             self.angle_tolerance = data.get('angle_tolerance', 0.01)
             self.max_iterations = data.get('max_iterations', 1000)
@@ -883,7 +1664,7 @@ class AdvancedPrismEditor:
             if 'start_cfg' in data: # Legacy support
                 self.start_configs = [{'id':1, **data['start_cfg']}]
 
-            self.next_id = max([p['id'] for p in self.prisms] + [0]) + 1
+            self.next_id = max(self.prisms.id, default=0) + 1
             self.next_start_id = max([s['id'] for s in self.start_configs] + [0]) + 1
             self.active_start_idx = 0
             
@@ -935,59 +1716,34 @@ class AdvancedPrismEditor:
 
 
     def save_state_for_undo(self):
-        if self.is_undoredo_op: return
-        if self.history_index < len(self.history) - 1: self.history = self.history[:self.history_index + 1]
-        state = {'prisms': copy.deepcopy(self.prisms), 'start_configs': copy.deepcopy(self.start_configs), 'next_id': self.next_id, 'next_start_id': self.next_start_id, 'active_start_idx': self.active_start_idx}
-        self.history.append(state)
-        self.history_index += 1
-        if len(self.history) > 50: self.history.pop(0); self.history_index -= 1
-        
-    def restore_from_history(self, state):
-        self.prisms = copy.deepcopy(state['prisms'])
-        self.start_configs = copy.deepcopy(state['start_configs'])
-        self.next_id = state['next_id']
-        self.next_start_id = state['next_start_id']
-        self.active_start_idx = state['active_start_idx']
-        self.is_undoredo_op = False
-        self.refresh_ui()
+        self.history.commit()
 
     def undo_action(self, event=None):
         if self.cut_ids: self.cut_ids = []; self.draw_scene(); return
-        if self.history_index > 0:
-            self.is_undoredo_op = True
-            self.history_index -= 1
-            self.restore_from_history(self.history[self.history_index])
+        if self.history.undo(): self.refresh_ui()
 
     def redo_action(self, event=None):
-        if self.history_index < len(self.history) - 1:
-            self.is_undoredo_op = True
-            self.history_index += 1
-            self.restore_from_history(self.history[self.history_index])
+        if self.history.redo(): self.refresh_ui()
             
     def toggle_auto_save(self):
         if self.auto_save_var.get():
+            self.history.journal = []
+            self.autosaver.reset()
             self.auto_save_state()
         else:
+            self.history.journal = None
             if hasattr(self, 'auto_save_timer'):
                 self.root.after_cancel(self.auto_save_timer)
 
     def auto_save_state(self):
-        data = {
-            'prisms': self.prisms, 
-            'start_configs': self.start_configs,
+        changes, self.history.journal = self.history.journal or [], []
+        params = (self.angle_tolerance, self.max_iterations)
+        self.autosaver.save(changes, params, lambda: {
+            'prisms': self.prisms.to_list(), 
+            'start_configs': [dict(s) for s in self.start_configs],
             'angle_tolerance': self.angle_tolerance,
             'max_iterations': self.max_iterations
-        }
-        save_directory = "prisms_data"
-        if not os.path.exists(save_directory):
-            os.makedirs(save_directory)
-        autosave_filepath = os.path.join(save_directory, "autosave.json")
-        
-        try:
-            with open(autosave_filepath, "w") as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            print(f"Auto-save failed: {e}")
+        })
             
         if self.auto_save_var.get():
             self.auto_save_timer = self.root.after(30000, self.auto_save_state)
@@ -1,69 +1,265 @@
+import argparse
+import csv
+import glob
+import hashlib
+import json
 import math
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+from multiprocessing import shared_memory
 
-def calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01):
+import numpy as np
+
+PRISM_TYPES = ("normal", "splitter", "combiner", "reducer", "amplifier")
+
+WAVEFRONT_CHUNK = 1 << 20 # Max rays x prisms entries evaluated per batch in wavefront mode
+
+def calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01, engine="python", wavefront=False, chunk_size=WAVEFRONT_CHUNK, stats=None, laser_budget=None, deadline=None, view=None, min_intensity=0, loop_history=None):
     """
     Calculates the paths for multiple laser beams with intensity and branching.
+    engine selects the hit lookup: "python" (spatial grid) or "numpy" (vectorized arrays).
+    wavefront=True resolves every queued ray of a generation in batched rays x prisms
+    NumPy passes of at most chunk_size entries; results are identical to the default mode.
+    If stats is a dict, it is filled with counters and per-phase timings (see TRACE_STATS).
+
+    max_iterations bounds the hits of all lasers together; the other limits are optional:
+    laser_budget caps the hits of each laser (an int, or one per start), deadline stops
+    the trace after that many seconds, and the visible-only mode stops beams at hits
+    outside view = (xmin, ymin, xmax, ymax) and does not follow rays dimmer than
+    min_intensity. Each result lists in 'truncated' the limits that cut its beams
+    (see TRUNCATIONS), empty when it was traced completely.
+
+    loop_history=N bounds the memory of long beams: a path restarts its loop-detection
+    history every N hops instead of keeping all of it. Loops shorter than N hops are
+    still caught, at most two histories late (so their first laps may repeat), longer
+    ones only stop at the other limits. None keeps the exact default detection.
+
+    A beam returning to a position and direction it already had is stopped there: the
+    orbit is traced once and described by loop_coords and loop_info (per-lap gain,
+    length, hops and the number of laps before attenuation_threshold, see _loop_info).
+    """
+    index = _make_index(prisms_list, engine, wavefront, stats)
+    return _trace_paths(starts, prisms_list, index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, wavefront, chunk_size, stats=stats, laser_budget=laser_budget, deadline=deadline, view=view, min_intensity=min_intensity, loop_history=loop_history)
+
+def iter_paths(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01, engine="python", wavefront=False, chunk_size=WAVEFRONT_CHUNK, stats=None, laser_budget=None, deadline=None, view=None, min_intensity=0, loop_history=None):
     """
-    queue = []
+    Streaming calculate_all_paths: returns a generator of (kind, start_idx, value) events
+    in the order the trace produces them. kind is "segment" (a segment tuple), "hit"
+    (a prism id), "loop" (loop_coords of the first loop of that start), "loop_info"
+    (its summary, right after it) or "truncated" (a TRUNCATIONS reason, once per start
+    and reason). Gathering the events of each start in order gives its segments,
+    sequence, loop_coords, loop_info and truncated; the
+    generator keeps none of them, only the history of the paths still being traced
+    (their nodes are freed as soon as no ray is left under them). A single long beam
+    still keeps its whole path for loop detection, unless loop_history bounds it.
+    stats are complete once the generator is exhausted; time_total then includes the time
+    spent by the consumer between events.
+    """
+    index = _make_index(prisms_list, engine, wavefront, stats)
+    return _trace_events(starts, prisms_list, index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, wavefront, chunk_size, stats=stats, laser_budget=laser_budget, deadline=deadline, view=view, min_intensity=min_intensity, loop_history=loop_history)
+
+def _make_index(prisms_list, engine, wavefront, stats=None):
+    t0 = time.perf_counter()
+    if wavefront or engine == "numpy":
+        index = PrismArrays(prisms_list)
+    elif engine == "python":
+        index = PrismGrid(prisms_list)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    if stats is not None:
+        stats['time_index'] = time.perf_counter() - t0
+    return index
+
+TRACE_STATS = {
+    'segments': "segments produced, final ones included",
+    'hits': "rays that hit a prism, the count bounded by max_iterations",
+    'hit_tests': "next-hit lookups",
+    'candidates': "prisms run through the cone test by those lookups",
+    'dropped': "rays cut by attenuation_threshold",
+    'loops': "rays stopped by loop detection",
+    'unpaired_combiner_hits': "combiner inputs still waiting for a partner at the end",
+    'peak_queue': "most rays queued at once",
+    'time_index': "seconds building the hit index",
+    'time_hit_tests': "seconds in next-hit lookups",
+    'time_loop_detection': "seconds in loop detection",
+    'time_advance': "seconds applying hits, including combiner pairing",
+    'time_total': "seconds in the trace loop, index excluded",
+}
+
+TRUNCATIONS = {
+    'max_iterations': "rays left when all lasers together reached max_iterations hits",
+    'budget': "rays left when the laser used up its laser_budget",
+    'deadline': "rays left when the deadline passed",
+    'view': "beams stopped at a hit outside the view",
+    'intensity': "rays dimmer than min_intensity",
+}
+
+def _trace_paths(starts, prisms_list, index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, wavefront=False, chunk_size=WAVEFRONT_CHUNK, on_hit=None, stats=None, laser_budget=None, deadline=None, view=None, min_intensity=0, loop_history=None):
+    """
+    calculate_all_paths with a prebuilt hit index: gathers the events of _trace_events.
+    on_hit(start_idx, x, y, angle, dist, prism) is called after every hit test.
+    """
+    all_segments = [[] for _ in range(len(starts))]
+    all_sequences = [[] for _ in range(len(starts))]
+    all_loop_coords = [None] * len(starts)
+    all_loop_info = [None] * len(starts)
+    all_truncated = [[] for _ in range(len(starts))]
+    for kind, s_idx, value in _trace_events(starts, prisms_list, index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, wavefront, chunk_size, on_hit, stats, laser_budget=laser_budget, deadline=deadline, view=view, min_intensity=min_intensity, loop_history=loop_history):
+        if kind == "segment":
+            all_segments[s_idx].append(value)
+        elif kind == "hit":
+            all_sequences[s_idx].append(value)
+        elif kind == "loop":
+            all_loop_coords[s_idx] = value
+        elif kind == "loop_info":
+            all_loop_info[s_idx] = value
+        else:
+            all_truncated[s_idx].append(value)
+
+    results = []
+    for i in range(len(starts)):
+        results.append({
+            "segments": all_segments[i],
+            "sequence": all_sequences[i],
+            "error": None,
+            "path_coords": [], # Kept for compatibility, but segments are primary
+            "loop_coords": all_loop_coords[i],
+            "loop_info": all_loop_info[i],
+            "error_lines": [],
+            "truncated": all_truncated[i]
+        })
+    return results
+
+def _trace_events(starts, prisms_list, index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, wavefront=False, chunk_size=WAVEFRONT_CHUNK, on_hit=None, stats=None, laser_budget=None, deadline=None, view=None, min_intensity=0, loop_history=None):
+    """Trace core: generator of the (kind, start_idx, value) events described in iter_paths."""
+    t_start = time.perf_counter()
+    # Rays point at a shared _PathNode for their position and history instead of
+    # carrying their own copies, so memory grows linearly with the segments traced.
+    queue = deque()
     for i, s in enumerate(starts):
         queue.append({
-            'x': s['x'], 'y': s['y'], 'angle': s['angle'], 
+            'node': _PathNode(s['x'], s['y']), 'angle': s['angle'], 
             'intensity': 1.0, 
-            'start_idx': i,
-            'path_coords': [(s['x'], s['y'])],
-            'visited': {}
+            'start_idx': i
         })
+        queue[-1]['node'].pending = 1
     
     combiner_hits = {}
-    
-    all_segments = [[] for _ in range(len(starts))]
-    all_sequences = [[] for _ in range(len(starts))]
-    all_loop_coords = [None] * len(starts)
-    
-    segments_count = 0
-    while queue and segments_count < max_iterations:
-        ray = queue.pop(0)
-        cx, cy, c_angle = ray['x'], ray['y'], ray['angle']
+    state_index = {}
+    looped = [False] * len(starts)
+    # The closures below queue their events here, the loops yield them after each ray.
+    events = []
+    emit = events.append
+
+    budget_left = None
+    if laser_budget is not None:
+        budget_left = list(laser_budget) if isinstance(laser_budget, (list, tuple)) else [laser_budget] * len(starts)
+    t_stop = t_start + deadline if deadline is not None else None
+    marked = set()
+
+    def truncate(s_idx, reason):
+        if (s_idx, reason) not in marked:
+            marked.add((s_idx, reason))
+            emit(("truncated", s_idx, reason))
+
+    def release(node):
+        """
+        Drops a node nothing depends on any more (no queued ray, waiting combiner input
+        or live child): only its own descendants could match its states, so they leave
+        state_index, and the node is freed along with the ancestors it was the last
+        to need. Memory then follows the live paths, not the whole trace.
+        """
+        node.pending -= 1
+        while node is not None and node.pending == 0:
+            for state in set(node.states):
+                entries = [entry for entry in state_index[state] if entry[0] is not node]
+                if entries: state_index[state] = entries
+                else: del state_index[state]
+            node = node.parent
+            if node is not None: node.pending -= 1
+
+    def stop_reason():
+        """The global limit that ends the trace now, if any."""
+        if segments_count >= max_iterations:
+            return "max_iterations"
+        if t_stop is not None and time.perf_counter() >= t_stop:
+            return "deadline"
+        return None
+
+    def enter(ray):
+        """Budget check and loop detection. Returns False if the ray must stop."""
+        if budget_left is not None and budget_left[ray['start_idx']] <= 0:
+            truncate(ray['start_idx'], "budget")
+            return False
+        node = ray['node']
+        state = _ray_state(ray)
+        loop_node = _find_loop(node, state, state_index)
+        if loop_node is not None:
+            if stats is not None: stats['loops'] += 1
+            s_idx = ray['start_idx']
+            if not looped[s_idx]: # Only handle the first loop detected for a given start
+                looped[s_idx] = True
+                coords = node.coords_from(loop_node)
+                emit(("loop", s_idx, coords))
+                # Levels of the lap from its first state to this ray, walking up the path.
+                levels = [ray.get('raw', ray['intensity'])]
+                n = node
+                while n is not loop_node:
+                    levels.append(n.parent.levels[n.parent_slot])
+                    n = n.parent
+                levels[-1] = loop_node.levels[loop_node.states.index(state)]
+                emit(("loop_info", s_idx, _loop_info(coords, levels[::-1], attenuation_factor, attenuation_threshold)))
+            return False # Stop processing this looped path
+
+        ray['slot'] = len(node.states)
+        node.states.append(state)
+        node.levels.append(ray.get('raw', ray['intensity']))
+        state_index.setdefault(state, []).append((node, ray['slot']))
+        return True
+
+    def advance(ray, dist, prism, out):
+        """Applies the hit (or the miss) of one ray, appending the next rays to out."""
+        node = ray['node']
+        cx, cy, c_angle = node.x, node.y, ray['angle']
         c_intensity = ray['intensity']
         s_idx = ray['start_idx']
-        
-        # Loop detection
-        rounded_angle = round(c_angle % 360, 3)
-        state = (cx, cy, rounded_angle)
-        if state in ray['visited']:
-            if all_loop_coords[s_idx] is None: # Only handle the first loop detected for a given start
-                loop_start_index = ray['visited'][state]
-                all_loop_coords[s_idx] = ray['path_coords'][loop_start_index:]
-            continue # Stop processing this looped path
-
-        ray['visited'][state] = len(ray['path_coords']) - 1
-        
-        dist, prism = find_next_hit(cx, cy, c_angle, prisms_list, angle_tolerance)
-        
+
         if prism:
-            new_path_coords = ray['path_coords'] + [(prism['x'], prism['y'])]
-            
             # Apply attenuation
             new_intensity = c_intensity * ((1.0 - attenuation_factor) ** dist)
             
             if new_intensity < attenuation_threshold:
                 # Truncate if needed
-                continue
+                if stats is not None: stats['dropped'] += 1
+                return 0
 
-            all_segments[s_idx].append((cx, cy, prism['x'], prism['y'], c_intensity, new_intensity))
-            all_sequences[s_idx].append(prism['id'])
-            segments_count += 1
+            emit(("segment", s_idx, (cx, cy, prism['x'], prism['y'], c_intensity, new_intensity)))
+            emit(("hit", s_idx, prism['id']))
+            if budget_left is not None:
+                budget_left[s_idx] -= 1
+            if view is not None and not (view[0] <= prism['x'] <= view[2] and view[1] <= prism['y'] <= view[3]):
+                truncate(s_idx, "view")
+                return 1
             
             p_type = prism.get('type', 'normal')
             p_factor = prism.get('intensity_factor', 1.0)
             p_angle = prism['angle']
             
             # Common properties for next rays in the queue
+            if loop_history is not None and node.depth + 1 >= loop_history:
+                child = _PathNode(prism['x'], prism['y']) # New history, the old one is freed once unused
+            else:
+                child = _PathNode(prism['x'], prism['y'], node, ray['slot'])
             next_ray_props = {
-                'x': prism['x'], 'y': prism['y'],
-                'start_idx': s_idx,
-                'path_coords': new_path_coords,
-                'visited': ray['visited'].copy()
+                'node': child,
+                'start_idx': s_idx
             }
 
             if p_type == 'combiner':
@@ -71,18 +267,27 @@ def calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, at
                 if pid not in combiner_hits: combiner_hits[pid] = []
                 combiner_hits[pid].append({'angle': c_angle, 'intensity': new_intensity, 'props': next_ray_props})
                 
+                next_ray_props['node'].pending += 1 # Held by the waiting input
                 if len(combiner_hits[pid]) >= 2:
                     h1 = combiner_hits[pid].pop(0)
                     h2 = combiner_hits[pid].pop(0)
+                    release(h1['props']['node'])
                     
                     a1 = math.radians(h1['angle']); a2 = math.radians(h2['angle'])
                     avg_angle = math.degrees(math.atan2(math.sin(a1) + math.sin(a2), math.cos(a1) + math.cos(a2)))
                     
-                    combined_intensity = min(1.0, (h1['intensity'] + h2['intensity']) * p_factor)
+                    raw = (h1['intensity'] + h2['intensity']) * p_factor
+                    combined_intensity = min(1.0, raw)
                     
-                    if combined_intensity >= attenuation_threshold:
-                        queue.append({**h2['props'], 'angle': avg_angle + p_angle, 'intensity': combined_intensity})
-                continue
+                    if combined_intensity < attenuation_threshold:
+                        if stats is not None: stats['dropped'] += 1
+                        release(h2['props']['node'])
+                    elif combined_intensity < min_intensity:
+                        truncate(h2['props']['start_idx'], "intensity")
+                        release(h2['props']['node'])
+                    else: # The queued ray takes over the input's hold on the node
+                        out.append({**h2['props'], 'angle': avg_angle + p_angle, 'intensity': combined_intensity, 'raw': raw})
+                return 1
             
             # Other types
             new_rays = []
@@ -93,12 +298,21 @@ def calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, at
                 new_rays.append({'angle': c_angle + p_angle, 'intensity': split_intensity})
                 new_rays.append({'angle': c_angle - p_angle, 'intensity': split_intensity})
             elif p_type == 'reducer' or p_type == 'amplifier':
-                mod_intensity = min(1.0, new_intensity * p_factor)
-                new_rays.append({'angle': c_angle + p_angle, 'intensity': mod_intensity})
+                raw = new_intensity * p_factor
+                new_rays.append({'angle': c_angle + p_angle, 'intensity': min(1.0, raw), 'raw': raw})
 
+            child = next_ray_props['node']
+            child.pending += 1 # Held while its rays are queued
             for r in new_rays:
-                if r['intensity'] >= attenuation_threshold:
-                    queue.append({**next_ray_props, **r})
+                if r['intensity'] < attenuation_threshold:
+                    if stats is not None: stats['dropped'] += 1
+                elif r['intensity'] < min_intensity:
+                    truncate(s_idx, "intensity")
+                else:
+                    out.append({**next_ray_props, **r})
+                    child.pending += 1
+            release(child)
+            return 1
         else:
             # Final segment logic
             final_len = 1000
@@ -112,19 +326,228 @@ def calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, at
             if dist > 0:
                 ex = cx + dist * math.cos(math.radians(c_angle))
                 ey = cy + dist * math.sin(math.radians(c_angle))
-                all_segments[s_idx].append((cx, cy, ex, ey, c_intensity, c_intensity * ((1.0 - attenuation_factor)**dist)))
+                emit(("segment", s_idx, (cx, cy, ex, ey, c_intensity, c_intensity * ((1.0 - attenuation_factor)**dist))))
+            return 0
 
-    results = []
-    for i in range(len(starts)):
-        results.append({
-            "segments": all_segments[i],
-            "sequence": all_sequences[i],
-            "error": None,
-            "path_coords": [], # Kept for compatibility, but segments are primary
-            "loop_coords": all_loop_coords[i],
-            "error_lines": []
-        })
-    return results
+    def hit_test(x, y, angle):
+        return index.find_next_hit(x, y, angle, angle_tolerance)
+    find_next_hits = getattr(index, 'find_next_hits', None)
+
+    if stats is not None:
+        for key in ('hits', 'hit_tests', 'dropped', 'loops', 'peak_queue'):
+            stats[key] = 0
+        for key in ('time_hit_tests', 'time_loop_detection', 'time_advance'):
+            stats[key] = 0.0
+        candidates_before = index.candidates
+        stats['peak_queue'] = len(queue)
+        stats['segments'] = 0
+        def emit(event):
+            if event[0] == "segment": stats['segments'] += 1
+            events.append(event)
+        enter = _timed(enter, stats, 'time_loop_detection')
+        advance = _timed(advance, stats, 'time_advance', queue_sizes=True)
+        hit_test = _timed(hit_test, stats, 'time_hit_tests', count='hit_tests')
+        if find_next_hits is not None:
+            find_next_hits = _timed(find_next_hits, stats, 'time_hit_tests', count='hit_tests', batched=True)
+
+    segments_count = 0
+    reason = None
+    if not wavefront:
+        while queue:
+            reason = stop_reason()
+            if reason:
+                break
+            ray = queue.popleft()
+            if enter(ray):
+                dist, prism = hit_test(ray['node'].x, ray['node'].y, ray['angle'])
+                if on_hit is not None:
+                    on_hit(ray['start_idx'], ray['node'].x, ray['node'].y, ray['angle'], dist, prism)
+                segments_count += advance(ray, dist, prism, queue)
+            release(ray['node'])
+            if events:
+                yield from events
+                events.clear()
+    else:
+        # Processing a whole generation in queue order and collecting its children
+        # in a new list visits rays in exactly the same order as the FIFO above.
+        batch_rays = max(1, chunk_size // max(1, len(prisms_list)))
+        while queue and not reason:
+            generation, queue = list(queue), []
+            if stats is not None and len(generation) > stats['peak_queue']:
+                stats['peak_queue'] = len(generation)
+            for c0 in range(0, len(generation), batch_rays):
+                reason = stop_reason()
+                if reason:
+                    queue = generation[c0:] + queue # Left for the truncation marks below
+                    break
+                chunk = generation[c0:c0 + batch_rays]
+                # Rays that already close a loop or are out of budget need no hit test. Siblings see
+                # each other's states, so enter() below can still stop a ray counted as live here.
+                live = [k for k, ray in enumerate(chunk) if (budget_left is None or budget_left[ray['start_idx']] > 0)
+                        and _find_loop(ray['node'], _ray_state(ray), state_index) is None]
+                hits = dict(zip(live, find_next_hits(
+                    [chunk[k]['node'].x for k in live], [chunk[k]['node'].y for k in live], [chunk[k]['angle'] for k in live], angle_tolerance)))
+                for k, ray in enumerate(chunk):
+                    reason = reason or stop_reason()
+                    if reason:
+                        truncate(ray['start_idx'], reason)
+                    elif enter(ray):
+                        dist, prism = hits[k]
+                        if on_hit is not None:
+                            on_hit(ray['start_idx'], ray['node'].x, ray['node'].y, ray['angle'], dist, prism)
+                        segments_count += advance(ray, dist, prism, queue)
+                    release(ray['node'])
+                    if events:
+                        yield from events
+                        events.clear()
+
+    for ray in queue:
+        truncate(ray['start_idx'], reason)
+    yield from events
+
+    if stats is not None:
+        stats['hits'] = segments_count
+        stats['candidates'] = index.candidates - candidates_before
+        stats['unpaired_combiner_hits'] = sum(len(h) for h in combiner_hits.values())
+        stats['time_total'] = time.perf_counter() - t_start
+
+def _timed(fn, stats, key, count=None, batched=False, queue_sizes=False):
+    """Wraps a trace phase to accumulate its time (and calls, or batch sizes) into stats."""
+    perf_counter = time.perf_counter
+    def timed(*args):
+        t0 = perf_counter()
+        value = fn(*args)
+        stats[key] += perf_counter() - t0
+        if count is not None:
+            stats[count] += len(args[0]) if batched else 1
+        if queue_sizes and len(args[-1]) > stats['peak_queue']:
+            stats['peak_queue'] = len(args[-1])
+        return value
+    return timed
+
+def _ray_state(ray):
+    rounded_angle = round(ray['angle'] % 360, 3)
+    return (ray['node'].x, ray['node'].y, rounded_angle)
+
+class _PathNode:
+    """
+    One vertex of a beam path in the ray tree: a start point or a prism hit.
+
+    Rays leaving the same hit share its node and record their loop-detection state
+    in node.states (and its level, the intensity before any 1.0 cap, in node.levels)
+    in processing order. A child node remembers the slot of the ray that created it,
+    so the states visible to a ray are the ones recorded on its own
+    node plus, on every ancestor, those recorded up to the slot its branch came from.
+    jump is a skip pointer (Myers' scheme) giving O(log depth) ancestor lookups.
+    """
+    __slots__ = ('x', 'y', 'parent', 'parent_slot', 'depth', 'jump', 'states', 'levels', 'pending')
+
+    def __init__(self, x, y, parent=None, parent_slot=0):
+        self.x, self.y = x, y
+        self.parent, self.parent_slot = parent, parent_slot
+        self.states = []
+        self.levels = [] # Level of the ray behind each state
+        self.pending = 0 # Queued rays, waiting combiner inputs and live children depending on the node
+        if parent is None:
+            self.depth, self.jump = 0, None
+            return
+        self.depth = parent.depth + 1
+        parent.pending += 1
+        j = parent.jump
+        if j is not None and j.jump is not None and parent.depth - j.depth == j.depth - j.jump.depth:
+            self.jump = j.jump
+        else:
+            self.jump = parent
+
+    def ancestor_at(self, depth):
+        node = self
+        while node.depth > depth:
+            node = node.jump if node.jump.depth >= depth else node.parent
+        return node
+
+    def coords_from(self, ancestor):
+        """Path coordinates from ancestor down to this node, both included."""
+        coords = []
+        node = self
+        while node is not ancestor:
+            coords.append((node.x, node.y))
+            node = node.parent
+        coords.append((node.x, node.y))
+        coords.reverse()
+        return coords
+
+def _loop_info(coords, levels, attenuation_factor, attenuation_threshold):
+    """
+    Closed-form summary of a periodic orbit. levels are the ray levels (intensities
+    before the 1.0 cap of amplifiers, reducers and combiners) at each state of the
+    traced lap, from the state the beam left to the same state reached again. Each
+    lap multiplies the intensity by gain (the intensity factors and the attenuation
+    over the loop length, splits included). A lap that hit the cap is not linear, so
+    gain is then measured over a second lap simulated from the first one's end; a lap
+    capped again comes back to the same intensity. cycles is the number of laps, the
+    traced one included, the beam completes before falling below attenuation_threshold,
+    or None if it never decays (gain >= 1). A lap is cut by its lowest intensity, which
+    can be a dip inside it (e.g. arriving at an amplifier), not by the one it ends at.
+    """
+    actual = [min(1.0, level) for level in levels]
+    lengths = [math.hypot(x2 - x1, y2 - y1) for (x1, y1), (x2, y2) in zip(coords, coords[1:])]
+    decay = [(1.0 - attenuation_factor) ** d for d in lengths]
+    info = {'gain': 0.0, 'length': sum(lengths), 'hops': len(coords) - 1, 'cycles': 1}
+
+    def lap(x):
+        """Runs one lap from intensity x. Returns (end intensity, lowest intensity tested on the way)."""
+        low = math.inf
+        for a, level, d in zip(actual, levels[1:], decay):
+            low = min(low, x * d) # Arrival, tested before the prism acts
+            x = min(1.0, x * level / a)
+            low = min(low, x)
+        return x, low
+
+    lap_start, intensity = actual[0], actual[-1]
+    if lap_start <= 0 or not all(a > 0 for a in actual[:-1]):
+        return info
+    laps, gain = 1, intensity / lap_start
+    if any(level > 1.0 for level in levels[1:]):
+        x, low = lap(intensity)
+        if low < attenuation_threshold:
+            info['gain'] = x / intensity
+            return info
+        laps, gain, intensity = 2, x / intensity, x
+    info['gain'] = gain
+    if gain >= 1 or (gain > 0 and attenuation_threshold <= 0):
+        info['cycles'] = None
+    elif gain <= 0:
+        info['cycles'] = laps
+    else:
+        _, low = lap(intensity) # Later laps stay under the cap, so they scale the same way
+        info['cycles'] = laps if low < attenuation_threshold else laps + 1 + int(math.log(attenuation_threshold / low) / math.log(gain))
+    return info
+
+def _find_loop(node, state, state_index):
+    """Returns the node where state was already seen along this ray's history, or None."""
+    candidates = state_index.get(state)
+    if not candidates:
+        return None
+    if len(candidates) < node.depth:
+        for owner, slot in candidates:
+            if owner is node:
+                return owner
+            if owner.depth >= node.depth:
+                continue
+            child = node.ancestor_at(owner.depth + 1)
+            if child.parent is owner and slot <= child.parent_slot:
+                return owner
+        return None
+    # Many branches went through this state: walking the ancestry is cheaper.
+    if state in node.states:
+        return node
+    child = node
+    while child.parent is not None:
+        owner = child.parent
+        if state in owner.states[:child.parent_slot + 1]:
+            return owner
+        child = owner
+    return None
 
 def calculate_path(start_config, prisms_list, angle_tolerance, max_iterations):
     """
@@ -141,18 +564,329 @@ def calculate_path(start_config, prisms_list, angle_tolerance, max_iterations):
             path_coords.append((seg[2], seg[3]))
     return res['sequence'], path_coords, None, []
 
-def find_next_hit(current_x, current_y, current_angle, prisms_list, angle_tolerance):
-    rad_angle = math.radians(current_angle)
+class AutoAim:
+    """
+    Auto-aim of the element that shoots last along a laser's beam, from a single trace.
+    While a drag only changes the shooter's own angle, later calls reuse the previous
+    trace and merely check that the re-aimed shooter still hits nothing.
+    """
+    def __init__(self):
+        self.last = None
+
+    def aim(self, start_config, prisms_list, target_x, target_y, angle_tolerance, max_iterations, exclude_ids=()):
+        """
+        Returns (shooter, incoming_angle, corrected_angle). shooter is the last prism hit
+        by the beam, or None when the laser itself has to turn; corrected_angle is then
+        absolute, otherwise it is the prism angle relative to incoming_angle.
+        """
+        excluded = set(exclude_ids)
+        prisms = [p for p in prisms_list if p['id'] not in excluded] if excluded else prisms_list
+        shooter, incoming_angle = self.find_shooter(start_config, prisms, angle_tolerance, max_iterations)
+        if shooter is None:
+            return None, start_config['angle'], math.degrees(math.atan2(target_y - start_config['y'], target_x - start_config['x']))
+        desired_abs_angle = math.degrees(math.atan2(target_y - shooter['y'], target_x - shooter['x']))
+        deviation = desired_abs_angle - incoming_angle
+        return shooter, incoming_angle, (deviation + 180) % 360 - 180
+
+    def find_shooter(self, start_config, prisms_list, angle_tolerance, max_iterations):
+        """Returns (shooter, incoming_angle) for the beam of start_config, shooter None if nothing is hit."""
+        last = self.last
+        if last is not None:
+            key, shooter = _aim_key(start_config, prisms_list, angle_tolerance, max_iterations, last['shooter_id'])
+            if key == last['key'] and shooter is not None and self._still_last(shooter, last, angle_tolerance):
+                return shooter, last['incoming']
+
+        index = PrismGrid(prisms_list)
+        hits = []
+        def on_hit(s_idx, x, y, angle, dist, prism):
+            if prism is not None:
+                hits.append((prism['id'], angle))
+
+        seq = _trace_paths([start_config], prisms_list, index, angle_tolerance, max_iterations, 0, 0.01, on_hit=on_hit)[0]['sequence']
+        self.last = None
+        if not seq:
+            return None, start_config['angle']
+
+        by_id = {p['id']: p for p in prisms_list}
+        shooter = by_id[seq[-1]]
+        # Cumulative deflection of the prisms before the shooter, as seen along the first beam.
+        incoming_angle = start_config['angle'] + sum(by_id[pid]['angle'] for pid in seq[:seq.index(shooter['id'])])
+        # Reusable only if the shooter's single visit is the last hit (no truncated hit after it). A
+        # shooter hit twice may have sent the beam round to itself, and re-aiming would change that too.
+        if hits[-1][0] == shooter['id'] and sum(pid == shooter['id'] for pid, _ in hits) == 1:
+            key, _ = _aim_key(start_config, prisms_list, angle_tolerance, max_iterations, shooter['id'])
+            self.last = {'key': key, 'shooter_id': shooter['id'], 'incoming': incoming_angle, 'arrival': hits[-1][1], 'index': index}
+        return shooter, incoming_angle
+
+    @staticmethod
+    def _still_last(shooter, last, angle_tolerance):
+        """True if the shooter's rays at its current angle leave the scene without hitting anything."""
+        p_type = shooter.get('type', 'normal')
+        if p_type == 'combiner':
+            return False
+        arrival, p_angle = last['arrival'], shooter['angle']
+        if p_type == 'splitter':
+            out_angles = (arrival + p_angle, arrival - p_angle)
+        elif p_type in ('normal', 'reducer', 'amplifier'):
+            out_angles = (arrival + p_angle,)
+        else:
+            out_angles = ()
+        return all(last['index'].find_next_hit(shooter['x'], shooter['y'], a, angle_tolerance)[1] is None for a in out_angles)
+
+def _aim_key(start_config, prisms_list, angle_tolerance, max_iterations, free_id):
+    """scene_fingerprint of one start, ignoring the angle of prism free_id. Also returns that prism."""
+    if isinstance(prisms_list, Scene):
+        free_row = prisms_list.rows.get(free_id)
+    else:
+        free_row = next((i for i, p in enumerate(prisms_list) if p['id'] == free_id), None)
+    free = None if free_row is None else prisms_list[free_row]
+    key = (len(prisms_list), _prism_digest(prisms_list, free_row), start_config['x'], start_config['y'], start_config['angle'], angle_tolerance, max_iterations)
+    return key, free
+
+def _prism_fields(prisms_list):
+    """(id, x, y, angle, type, intensity_factor) of every prism, column-wise for a Scene."""
+    if isinstance(prisms_list, Scene):
+        return prisms_list.fields()
+    return ((p['id'], p['x'], p['y'], p['angle'], p.get('type', 'normal'), p.get('intensity_factor', 1.0)) for p in prisms_list)
+
+def _prism_digest(prisms_list, free_row=None):
+    """
+    blake2b digest of the exact bytes of every prism field, leaving out the angle of
+    free_row if given. hash() is no use here: floats such as -1.0 and -2.0 collide.
+    """
+    if isinstance(prisms_list, Scene):
+        columns, types = list(prisms_list.columns.values()), prisms_list.types
+    else:
+        records, types = _prism_records(prisms_list)
+        columns = [np.ascontiguousarray(records[key]) for key in Scene.FIELDS]
+    if free_row is not None:
+        columns[3] = array('d', columns[3])
+        columns[3][free_row] = math.nan
+    digest = hashlib.blake2b(digest_size=16)
+    for col in columns:
+        digest.update(col)
+    digest.update(json.dumps(types).encode("utf-8"))
+    return digest.digest()
+
+def scene_fingerprint(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01):
+    """
+    Exact structural key of everything a trace depends on. Prisms are folded into a
+    digest of their fields, so the key stays small whatever the scene size.
+    """
+    prism_hash = prisms_list.content_hash() if isinstance(prisms_list, Scene) else _prism_digest(prisms_list)
+    start_fields = tuple((s['x'], s['y'], s['angle']) for s in starts)
+    return (len(prisms_list), prism_hash, start_fields, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold)
+
+class TraceCache:
+    """
+    Bounded LRU memo of trace results keyed by scene_fingerprint.
+    Cached results are shared between callers and must not be mutated.
+    """
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        results = self.entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return results
+
+    def put(self, key, results):
+        self.entries[key] = results
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def trace(self, starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01, laser_budget=None, deadline=None, view=None, min_intensity=0, loop_history=None, stats=None, **kwargs):
+        """
+        calculate_all_paths through the cache. The limits are part of the key, except
+        deadline: a trace cut by time depends on the machine, so it is never cached or
+        served from the cache. A call passing stats always traces, to fill them.
+        kwargs (engine, wavefront...) do not change results.
+        """
+        key = scene_fingerprint(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold)
+        if isinstance(laser_budget, list): laser_budget = tuple(laser_budget)
+        key += (laser_budget, None if view is None else tuple(view), min_intensity, loop_history)
+        results = self.get(key) if deadline is None and stats is None else None
+        if results is None:
+            results = calculate_all_paths(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, stats=stats,
+                                          laser_budget=laser_budget, deadline=deadline, view=view, min_intensity=min_intensity, loop_history=loop_history, **kwargs)
+            if deadline is None: self.put(key, results)
+        return results
+
+class _TraceCancelled(Exception):
+    """Raised from a hit callback to abandon a TraceSession trace."""
+
+class TraceSession:
+    """
+    Incremental tracer for interactive editing.
+
+    trace() takes the whole scene on every call, diffs it against the previous call
+    and only retraces the lasers a change can affect: lasers whose beams tested
+    against an edited prism, and lasers with a beam cone that reaches a moved or
+    added prism before the beam's own hit. Lasers coupled through a combiner are
+    retraced together. Anything the diff cannot bound (new parameters, reordered
+    prisms, too many edits, max_iterations being reached) falls back to a full
+    trace, so the results always equal calculate_all_paths.
+
+    cancel, if given, is polled between hit tests; once it returns true the trace
+    is abandoned, trace() returns None and the session keeps its previous state.
+    """
+    MAX_CHANGED = 64
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.cancel = None
+        self.params = None
+        self.starts = None
+        self.prisms = None
+        self.order = None
+        self.index = None
+        self.results = None
+        self.records = None
+        self.truncated = False
+
+    def trace(self, starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor=0, attenuation_threshold=0.01, cancel=None):
+        saved = (self.params, self.starts, self.prisms, self.order)
+        try:
+            return self._trace(starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, cancel)
+        except _TraceCancelled:
+            # results and records are only replaced once a run completes; the index
+            # may already hold the new positions, so it is rebuilt on the next call.
+            self.params, self.starts, self.prisms, self.order = saved
+            self.index = None
+            return None
+
+    def _trace(self, starts, prisms_list, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, cancel):
+        params = (angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold)
+        start_snap = [(s['x'], s['y'], s['angle']) for s in starts]
+        fields = list(_prism_fields(prisms_list))
+        prism_snap = {f[0]: f[1:] for f in fields}
+        order = [f[0] for f in fields]
+        by_id = dict(zip(order, prisms_list))
+
+        affected = self._affected(params, start_snap, prism_snap, order, by_id)
+        if affected:
+            # Combiners pair beams across lasers, so coupled lasers are retraced together.
+            combiner_ids = {pid for snaps in (self.prisms, prism_snap) for pid, snap in snaps.items() if snap[3] == 'combiner'}
+            affected = self._close_over_combiners(affected, combiner_ids)
+        self._sync_index(prisms_list, prism_snap, order)
+        self.params, self.starts, self.prisms, self.order = params, start_snap, prism_snap, order
+
+        self.cancel = cancel
+        if affected is None:
+            return self._full_trace(starts, prisms_list)
+        if not affected:
+            return list(self.results)
+
+        subset = sorted(affected)
+        others = [i for i in range(len(starts)) if i not in affected]
+        budget = max_iterations - sum(self.records[i]['hits'] for i in others)
+        if budget <= 0:
+            return self._full_trace(starts, prisms_list)
+
+        results, records = self._run([starts[i] for i in subset], prisms_list, budget)
+        if sum(rec['hits'] for rec in records) >= budget:
+            return self._full_trace(starts, prisms_list)
+        new_combiners = {pid for rec in records for pid in rec['touched'] & combiner_ids}
+        if any(self.records[i]['touched'] & new_combiners for i in others):
+            return self._full_trace(starts, prisms_list)
+
+        self.results = list(self.results)
+        for i, res, rec in zip(subset, results, records):
+            self.results[i], self.records[i] = res, rec
+        return list(self.results)
+
+    def _affected(self, params, start_snap, prism_snap, order, by_id):
+        """Indices of the starts to retrace, or None when a full trace is needed."""
+        if self.results is None or self.truncated or params != self.params or len(start_snap) != len(self.starts):
+            return None
+        affected = {i for i, (new, old) in enumerate(zip(start_snap, self.starts)) if new != old}
+
+        old = self.prisms
+        changed = [pid for pid in order if old.get(pid) != prism_snap[pid]]
+        removed = [pid for pid in self.order if pid not in prism_snap]
+        if len(changed) + len(removed) > self.MAX_CHANGED:
+            return None
+        if order != self.order and [pid for pid in order if pid in old] != [pid for pid in self.order if pid in prism_snap]:
+            return None # Surviving prisms were reordered, which can change tie-breaks
+
+        for pid in changed + removed:
+            affected.update(i for i, rec in enumerate(self.records) if pid in rec['touched'])
+        tol = params[0]
+        for pid in changed:
+            if pid in old and old[pid][:2] == prism_snap[pid][:2]:
+                continue # Same position: only lasers that already tested it care
+            p = by_id[pid]
+            for i, rec in enumerate(self.records):
+                if i in affected: continue
+                for qx, qy, q_angle, q_dist in rec['queries']:
+                    dist = _hit_distance(p, qx, qy, q_angle, tol)
+                    if dist is not None and (q_dist is None or dist <= q_dist):
+                        affected.add(i)
+                        break
+        return affected
+
+    def _close_over_combiners(self, affected, combiner_ids):
+        touched = [rec['touched'] & combiner_ids for rec in self.records]
+        affected = set(affected)
+        grown = True
+        while grown:
+            shared = set().union(*(touched[i] for i in affected))
+            extra = {i for i in range(len(touched)) if i not in affected and touched[i] & shared}
+            affected |= extra
+            grown = bool(extra)
+        return affected
+
+    def _sync_index(self, prisms_list, prism_snap, order):
+        if self.index is None or order != self.order:
+            self.index = PrismGrid(prisms_list)
+            return
+        self.index.bind(prisms_list)
+        for i, pid in enumerate(order):
+            old_x, old_y = self.prisms[pid][:2]
+            if (old_x, old_y) != prism_snap[pid][:2]:
+                self.index.move(i, old_x, old_y)
+
+    def _full_trace(self, starts, prisms_list):
+        self.results, self.records = self._run(starts, prisms_list, self.params[1])
+        self.truncated = sum(rec['hits'] for rec in self.records) >= self.params[1]
+        return list(self.results)
+
+    def _run(self, starts, prisms_list, max_iterations):
+        angle_tolerance, _, attenuation_factor, attenuation_threshold = self.params
+        records = [{'touched': set(), 'queries': [], 'hits': 0} for _ in starts]
+
+        cancel = self.cancel
+
+        def on_hit(s_idx, x, y, angle, dist, prism):
+            if cancel is not None and cancel():
+                raise _TraceCancelled()
+            rec = records[s_idx]
+            rec['queries'].append((x, y, angle, dist))
+            if prism is not None:
+                rec['touched'].add(prism['id'])
+
+        results = _trace_paths(starts, prisms_list, self.index, angle_tolerance, max_iterations, attenuation_factor, attenuation_threshold, on_hit=on_hit)
+        for rec, res in zip(records, results):
+            rec['hits'] = len(res['sequence'])
+        return results, records
+
+def find_next_hit(current_x, current_y, current_angle, prisms_list, angle_tolerance, index=None):
+    if index is not None:
+        return index.find_next_hit(current_x, current_y, current_angle, angle_tolerance)
     candidates = []
     for p in prisms_list:
-        dx = p['x'] - current_x
-        dy = p['y'] - current_y
-        dist = math.sqrt(dx*dx + dy*dy)
-        if dist < 0.1: continue 
-        
-        angle_to_point = math.degrees(math.atan2(dy, dx))
-        diff = (angle_to_point - current_angle + 180) % 360 - 180
-        if abs(diff) < angle_tolerance:
+        dist = _hit_distance(p, current_x, current_y, current_angle, angle_tolerance)
+        if dist is not None:
             candidates.append((dist, p))
     
     if not candidates:
@@ -160,3 +894,834 @@ def find_next_hit(current_x, current_y, current_angle, prisms_list, angle_tolera
     
     candidates.sort(key=lambda x: x[0])
     return candidates[0]
+
+def _hit_distance(p, current_x, current_y, current_angle, angle_tolerance):
+    """
+    Distance from the ray origin to prism p if p lies inside the tolerance cone, else None.
+    Every hit engine goes through this test so they all agree on borderline prisms.
+    """
+    return _cone_distance(p['x'], p['y'], current_x, current_y, current_angle, angle_tolerance)
+
+def _cone_distance(px, py, current_x, current_y, current_angle, angle_tolerance):
+    """_hit_distance for a prism at (px, py)."""
+    dx = px - current_x
+    dy = py - current_y
+    dist = math.sqrt(dx*dx + dy*dy)
+    if dist < 0.1: return None
+    
+    angle_to_point = math.degrees(math.atan2(dy, dx))
+    diff = (angle_to_point - current_angle + 180) % 360 - 180
+    if abs(diff) < angle_tolerance:
+        return dist
+    return None
+
+class PrismGrid:
+    """
+    Uniform grid over prism (x, y) positions.
+
+    find_next_hit marches along the beam in slabs one cell deep and only visits the
+    cells covered by the tolerance cone, stopping as soon as no unvisited cell can
+    hold a closer prism. Ties are broken by list order, like the linear scan.
+    """
+    def __init__(self, prisms_list, cell_size=None):
+        self.bind(prisms_list)
+        self.cells = {}
+        self.candidates = 0 # Prisms cone-tested so far, for trace stats
+        if not prisms_list:
+            self.cell_size = 1.0
+            self.bounds = None
+            return
+
+        xs, ys = self.xs, self.ys
+        min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+        if cell_size is None:
+            w, h = max_x - min_x, max_y - min_y
+            cell_size = max(math.sqrt(w * h / len(prisms_list)), max(w, h) / len(prisms_list), 1.0)
+        self.cell_size = cell_size
+        self.bounds = (min_x, min_y, max_x, max_y)
+
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            key = (math.floor(x / cell_size), math.floor(y / cell_size))
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [i]
+            else:
+                bucket.append(i)
+        self.cell_range = (math.floor(min_x / cell_size), math.floor(min_y / cell_size),
+                           math.floor(max_x / cell_size), math.floor(max_y / cell_size))
+
+    def bind(self, prisms_list):
+        """Points the grid at prisms_list, same prisms in the same order (a Scene's columns are used as is)."""
+        self.prisms = prisms_list
+        if isinstance(prisms_list, Scene):
+            self.xs, self.ys = prisms_list.x, prisms_list.y
+        else:
+            self.xs, self.ys = [p['x'] for p in prisms_list], [p['y'] for p in prisms_list]
+
+    def move(self, i, old_x, old_y):
+        """Re-buckets prism i after its position changed from (old_x, old_y), once bound to the moved prisms."""
+        cs = self.cell_size
+        x, y = self.xs[i], self.ys[i]
+        old_key = (math.floor(old_x / cs), math.floor(old_y / cs))
+        key = (math.floor(x / cs), math.floor(y / cs))
+        if key != old_key:
+            bucket = self.cells[old_key]
+            bucket.remove(i)
+            if not bucket: del self.cells[old_key]
+            self.cells.setdefault(key, []).append(i)
+        # Bounds only grow, which keeps the march limits conservative.
+        min_x, min_y, max_x, max_y = self.bounds
+        self.bounds = (min(min_x, x), min(min_y, y), max(max_x, x), max(max_y, y))
+        min_ix, min_iy, max_ix, max_iy = self.cell_range
+        self.cell_range = (min(min_ix, key[0]), min(min_iy, key[1]), max(max_ix, key[0]), max(max_iy, key[1]))
+
+    def find_next_hit(self, current_x, current_y, current_angle, angle_tolerance):
+        if self.bounds is None:
+            return None, None
+        if angle_tolerance >= 90:
+            # The cone is wider than a half-plane, marching forward cannot bound it.
+            self.candidates += len(self.prisms)
+            return find_next_hit(current_x, current_y, current_angle, self.prisms, angle_tolerance)
+
+        cs = self.cell_size
+        min_x, min_y, max_x, max_y = self.bounds
+        min_ix, min_iy, max_ix, max_iy = self.cell_range
+        rad = math.radians(current_angle)
+        ux, uy = math.cos(rad), math.sin(rad)
+        spread = math.tan(math.radians(max(angle_tolerance, 0.0)))
+        pad = cs * 1e-6 + 1e-9
+
+        # No prism is closer than the bounding box, or farther than its farthest corner.
+        near_x = min(max(current_x, min_x), max_x) - current_x
+        near_y = min(max(current_y, min_y), max_y) - current_y
+        t = math.sqrt(near_x*near_x + near_y*near_y) * math.cos(math.radians(min(angle_tolerance, 90)))
+        far_x = max(abs(current_x - min_x), abs(current_x - max_x))
+        far_y = max(abs(current_y - min_y), abs(current_y - max_y))
+        t_end = math.sqrt(far_x*far_x + far_y*far_y)
+        # Past these distances the whole cone slice is outside the box on that axis.
+        if ux > spread: t_end = min(t_end, (max_x - current_x) / (ux - spread))
+        elif -ux > spread: t_end = min(t_end, (current_x - min_x) / (-ux - spread))
+        if uy > spread: t_end = min(t_end, (max_y - current_y) / (uy - spread))
+        elif -uy > spread: t_end = min(t_end, (current_y - min_y) / (-uy - spread))
+        t_end += cs
+        t = max(0.0, math.floor(t / cs - 1) * cs)
+
+        px, py = self.xs, self.ys
+        cells = self.cells
+        seen = set()
+        best_dist, best_i = None, None
+        while t <= t_end:
+            t_next = t + cs
+            # Bounding box of the cone slice between t and t_next.
+            xs = []
+            ys = []
+            for a in (t, t_next):
+                cx, cy, w = current_x + ux * a, current_y + uy * a, a * spread
+                xs.extend((cx - uy * w, cx + uy * w))
+                ys.extend((cy + ux * w, cy - ux * w))
+            ix0 = max(min_ix, math.floor((min(xs) - pad) / cs))
+            ix1 = min(max_ix, math.floor((max(xs) + pad) / cs))
+            iy0 = max(min_iy, math.floor((min(ys) - pad) / cs))
+            iy1 = min(max_iy, math.floor((max(ys) + pad) / cs))
+            for ix in range(ix0, ix1 + 1):
+                for iy in range(iy0, iy1 + 1):
+                    key = (ix, iy)
+                    if key in seen: continue
+                    seen.add(key)
+                    bucket = cells.get(key)
+                    if bucket is None: continue
+                    self.candidates += len(bucket)
+                    for i in bucket:
+                        dist = _cone_distance(px[i], py[i], current_x, current_y, current_angle, angle_tolerance)
+                        if dist is None: continue
+                        if best_dist is None or dist < best_dist or (dist == best_dist and i < best_i):
+                            best_dist, best_i = dist, i
+            # Anything not visited yet lies beyond t_next along the beam.
+            if best_dist is not None and best_dist < t_next - pad:
+                break
+            t = t_next
+
+        if best_dist is None:
+            return None, None
+        return best_dist, self.prisms[best_i]
+
+class PrismArrays:
+    """
+    Prism x/y/angle/type/factor stored as contiguous NumPy arrays.
+
+    find_next_hit evaluates the cone test for every prism at once and picks the
+    nearest candidate with argmin. The vector test runs with a tiny angular margin
+    and the winner is confirmed with the scalar test, so results match the
+    dict-based scan bit for bit.
+    """
+    ANGLE_MARGIN = 1e-9
+
+    def __init__(self, prisms_list):
+        self.prisms = prisms_list
+        self.candidates = 0 # Prisms cone-tested so far, for trace stats
+        if isinstance(prisms_list, Scene):
+            # Column copies, no per-prism work.
+            self.x, self.y, self.angle, self.factor = (np.array(col, dtype=np.float64) for col in (prisms_list.x, prisms_list.y, prisms_list.angle, prisms_list.factor))
+            codes = np.array(prisms_list.type, dtype=np.int8)
+            self.type = np.array([_type_code(t) for t in prisms_list.types], dtype=np.int8)[codes] if len(codes) else codes
+            return
+        self.x = np.array([p['x'] for p in prisms_list], dtype=np.float64)
+        self.y = np.array([p['y'] for p in prisms_list], dtype=np.float64)
+        self.angle = np.array([p['angle'] for p in prisms_list], dtype=np.float64)
+        self.type = np.array([_type_code(p.get('type', 'normal')) for p in prisms_list], dtype=np.int8)
+        self.factor = np.array([p.get('intensity_factor', 1.0) for p in prisms_list], dtype=np.float64)
+
+    def find_next_hit(self, current_x, current_y, current_angle, angle_tolerance):
+        return self.find_next_hits([current_x], [current_y], [current_angle], angle_tolerance)[0]
+
+    def find_next_hits(self, xs, ys, angles, angle_tolerance):
+        """Resolves the next hit of many rays in one rays x prisms pass. Returns a list of (dist, prism)."""
+        if not self.prisms or not len(xs):
+            return [(None, None)] * len(xs)
+        self.candidates += len(xs) * len(self.prisms)
+        dx = self.x - np.asarray(xs, dtype=np.float64)[:, None]
+        dy = self.y - np.asarray(ys, dtype=np.float64)[:, None]
+        dist = np.sqrt(dx*dx + dy*dy)
+        diff = (np.degrees(np.arctan2(dy, dx)) - np.asarray(angles, dtype=np.float64)[:, None] + 180) % 360 - 180
+        mask = (dist >= 0.1) & (np.abs(diff) < angle_tolerance + self.ANGLE_MARGIN)
+        masked_dist = np.where(mask, dist, np.inf)
+        nearest = np.argmin(masked_dist, axis=1)
+
+        hits = []
+        for r, i in enumerate(nearest.tolist()):
+            cx, cy, c_angle = xs[r], ys[r], angles[r]
+            if masked_dist[r, i] == np.inf:
+                hits.append((None, None))
+                continue
+            dist_i = _hit_distance(self.prisms[i], cx, cy, c_angle, angle_tolerance)
+            if dist_i is not None:
+                hits.append((dist_i, self.prisms[i]))
+            else:
+                # Borderline prism let through by the margin, fall back to the row scan.
+                masked_dist[r, i] = np.inf
+                hits.append(self._pick(masked_dist[r], cx, cy, c_angle, angle_tolerance))
+        return hits
+
+    def _pick(self, masked_dist, current_x, current_y, current_angle, angle_tolerance):
+        while True:
+            i = int(np.argmin(masked_dist))
+            if masked_dist[i] == np.inf:
+                return None, None
+            dist = _hit_distance(self.prisms[i], current_x, current_y, current_angle, angle_tolerance)
+            if dist is not None:
+                return dist, self.prisms[i]
+            masked_dist[i] = np.inf
+
+def _type_code(p_type):
+    return PRISM_TYPES.index(p_type) if p_type in PRISM_TYPES else -1
+
+class Scene(Sequence):
+    """
+    Columnar prism storage shared by the editor and the engine.
+
+    Each prism field is a typed array indexed by row (x, y, angle and factor as
+    doubles, id as int64, type as a code into self.types, which starts as
+    PRISM_TYPES), and rows maps ids to rows. Iterating or indexing a Scene gives
+    PrismRef handles that read and write the columns like the prism dicts used
+    elsewhere (p['x'], p.get('type', 'normal'), dict(p)), so the engine takes a
+    Scene wherever it takes a prism list. Every change increases version, and
+    changes that move, add or remove prisms also log their ids (see moved_since)
+    so indexes over the positions can follow edits without a rebuild.
+    """
+    FIELDS = ('id', 'x', 'y', 'angle', 'type', 'intensity_factor')
+
+    def __init__(self, prisms_list=()):
+        self.id = array('q')
+        self.x = array('d')
+        self.y = array('d')
+        self.angle = array('d')
+        self.type = array('b')
+        self.factor = array('d')
+        self.columns = {'id': self.id, 'x': self.x, 'y': self.y, 'angle': self.angle, 'type': self.type, 'intensity_factor': self.factor}
+        self.types = list(PRISM_TYPES)
+        self.rows = {} # id -> row
+        self.refs = [] # Handle of each row once asked for (None before), rows shift on delete
+        self.version = 0
+        self.moved = deque() # (version, ids moved, added or removed by that change)
+        self.moved_count = 0 # Ids held by moved, bounded by the scene size
+        self.moved_from = 0 # moved covers every change after this version
+        self.hashed = (None, None) # (version, digest) of the last content_hash
+        self.extend(prisms_list)
+
+    @classmethod
+    def from_records(cls, records, types=PRISM_TYPES):
+        """Builds a Scene straight from PRISM_DTYPE records (see load_scene), column by column."""
+        scene = cls()
+        scene.types = list(types)
+        for key, col in scene.columns.items():
+            col.frombytes(np.ascontiguousarray(records[key], dtype=col.typecode).tobytes())
+        scene.refs = [None] * len(records)
+        scene.rows = {pid: row for row, pid in enumerate(scene.id)}
+        return scene
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __iter__(self):
+        for row, ref in enumerate(self.refs):
+            yield ref if ref is not None else self[row]
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self.refs)))]
+        ref = self.refs[row]
+        if ref is None:
+            row = row % len(self.refs)
+            ref = self.refs[row] = PrismRef(self, row)
+        return ref
+
+    def __repr__(self):
+        return f"Scene({self.to_list()!r})"
+
+    def by_id(self, pid):
+        row = self.rows.get(pid)
+        return None if row is None else self[row]
+
+    def type_code(self, p_type):
+        if p_type not in self.types:
+            self.types.append(p_type)
+        return self.types.index(p_type)
+
+    def append(self, p):
+        """Adds a prism (a dict or a PrismRef) as the last row and returns its handle."""
+        return self.insert(len(self.refs), p)
+
+    def extend(self, prisms_list):
+        prisms_list = list(prisms_list)
+        start = len(self.refs)
+        for key, col in self.columns.items():
+            if key == 'type': col.extend(self.type_code(p.get('type', 'normal')) for p in prisms_list)
+            elif key == 'intensity_factor': col.extend(p.get('intensity_factor', 1.0) for p in prisms_list)
+            else: col.extend(p[key] for p in prisms_list)
+        self.refs.extend([None] * len(prisms_list))
+        self._renumber(start)
+        self.version += 1
+        self._log_moved(self.id[start:].tolist())
+
+    def insert(self, row, p):
+        """Adds a prism at row, moving the following rows down by one. Returns its handle."""
+        for key, col in self.columns.items():
+            if key == 'type': value = self.type_code(p.get('type', 'normal'))
+            elif key == 'intensity_factor': value = p.get('intensity_factor', 1.0)
+            else: value = p[key]
+            col.insert(row, value)
+        ref = PrismRef(self, row)
+        self.refs.insert(row, ref)
+        self._renumber(row)
+        self.version += 1
+        self._log_moved([self.id[row]])
+        return ref
+
+    def delete(self, ids):
+        """Removes the prisms with these ids, their handles become invalid."""
+        keep = ~np.isin(np.frombuffer(self.id, dtype=np.int64), list(ids))
+        if keep.all():
+            return
+        for col in self.columns.values():
+            kept = np.frombuffer(col, dtype=col.typecode)[keep].tobytes()
+            col[:] = array(col.typecode, kept)
+        keep = keep.tolist()
+        for ref, kept in zip(self.refs, keep):
+            if not kept and ref is not None: ref.row = None
+        self.refs = [ref for ref, kept in zip(self.refs, keep) if kept]
+        self.rows = {}
+        self._renumber(0)
+        self.version += 1
+        self._log_moved(list(ids))
+
+    def set(self, row, key, value):
+        moved = [self.id[row]] if key in ('x', 'y') else None
+        if key == 'type':
+            value = self.type_code(value)
+        elif key == 'id':
+            moved = [self.id[row], value]
+            del self.rows[self.id[row]]
+            self.rows[value] = row
+        self.columns[key][row] = value
+        self.version += 1
+        if moved: self._log_moved(moved)
+
+    def rows_of(self, ids):
+        """Rows of the prisms with these ids as an int array, in row order (unknown ids are skipped)."""
+        return np.flatnonzero(np.isin(np.frombuffer(self.id, dtype=np.int64), list(ids)))
+
+    def column(self, key):
+        """Writable numpy view of a column. Do not keep it: the column cannot grow while it exists."""
+        col = self.columns[key]
+        return np.frombuffer(col, dtype=col.typecode)
+
+    def assign(self, rows, **values):
+        """
+        Sets fields of many rows at once, e.g. assign(rows, angle=45, type='splitter').
+        Each value is a scalar or a sequence aligned with rows; ids cannot be assigned.
+        """
+        for key, value in values.items():
+            if key == 'id':
+                raise ValueError("Prism ids cannot be bulk assigned")
+            if key == 'type':
+                value = self.type_code(value) if isinstance(value, str) else [self.type_code(t) for t in value]
+            self.column(key)[rows] = value
+        self.version += 1
+        if 'x' in values or 'y' in values:
+            self._log_moved(self.column('id')[rows].tolist())
+
+    def transform(self, rows, dx=0.0, dy=0.0, rotate=0.0, scale=1.0, about=None, snap=None):
+        """
+        Scales by scale and rotates by rotate degrees about the point about (the
+        centroid of the rows by default), then translates by (dx, dy). Prism angles
+        are deflections relative to the incoming beam, so they do not change. snap is
+        applied to the new coordinates (e.g. lambda v: np.round(v, 3)).
+        """
+        x, y = self.column('x'), self.column('y')
+        px, py = x[rows], y[rows]
+        if rotate or scale != 1.0:
+            cx, cy = about if about is not None else (px.mean(), py.mean())
+            c, s = scale * math.cos(math.radians(rotate)), scale * math.sin(math.radians(rotate))
+            px, py = cx + c * (px - cx) - s * (py - cy), cy + s * (px - cx) + c * (py - cy)
+        px, py = px + dx, py + dy
+        if snap is not None:
+            px, py = snap(px), snap(py)
+        x[rows], y[rows] = px, py
+        self.version += 1
+        self._log_moved(self.column('id')[rows].tolist())
+
+    def _log_moved(self, ids):
+        """Records ids as moved, added or removed by the change that made the current version."""
+        self.moved.append((self.version, ids))
+        self.moved_count += len(ids)
+        # Past one scene's worth of ids, replaying the log costs more than a rebuild.
+        while self.moved_count > max(len(self.refs), 1024) and len(self.moved) > 1:
+            version, dropped = self.moved.popleft()
+            self.moved_count -= len(dropped)
+            self.moved_from = version
+
+    def moved_since(self, version):
+        """Set of the ids moved, added or removed after version, or None when the log no longer reaches back that far."""
+        if version is None or version < self.moved_from:
+            return None
+        ids = set()
+        for v, changed in reversed(self.moved):
+            if v <= version: break
+            ids.update(changed)
+        return ids
+
+    def _renumber(self, start):
+        rows, ids, refs = self.rows, self.id, self.refs
+        for row in range(start, len(refs)):
+            if refs[row] is not None: refs[row].row = row
+            rows[ids[row]] = row
+
+    def fields(self, rows=None):
+        """(id, x, y, angle, type, intensity_factor) of every row (or of these rows), read column-wise."""
+        types = self.types
+        if rows is not None:
+            cols = [self.column(key)[rows].tolist() for key in self.FIELDS]
+            cols[4] = [types[c] for c in cols[4]]
+            return zip(*cols)
+        return zip(self.id, self.x, self.y, self.angle, [types[c] for c in self.type], self.factor)
+
+    def to_list(self, rows=None):
+        """The prisms (or these rows) as a list of dicts, e.g. for JSON."""
+        return [dict(zip(self.FIELDS, f)) for f in self.fields(rows)]
+
+    def copy(self):
+        scene = Scene()
+        for key, col in self.columns.items():
+            scene.columns[key].extend(col)
+        scene.types = list(self.types)
+        scene.rows = dict(self.rows)
+        scene.refs = [None] * len(self.refs)
+        scene.version = scene.moved_from = self.version
+        return scene
+
+    def content_hash(self):
+        """Exact digest of every prism field (see _prism_digest), recomputed only when version changed."""
+        if self.hashed[0] != self.version:
+            self.hashed = (self.version, _prism_digest(self))
+        return self.hashed[1]
+
+class PrismRef:
+    """Handle on one Scene row with the dict interface of a prism."""
+    __slots__ = ('scene', 'row')
+
+    def __init__(self, scene, row):
+        self.scene, self.row = scene, row
+
+    def __getitem__(self, key):
+        value = self.scene.columns[key][self.row]
+        return self.scene.types[value] if key == 'type' else value
+
+    def __setitem__(self, key, value):
+        self.scene.set(self.row, key, value)
+
+    def get(self, key, default=None):
+        return self[key] if key in self.scene.columns else default
+
+    def keys(self):
+        return Scene.FIELDS
+
+    def __iter__(self):
+        return iter(Scene.FIELDS)
+
+    def __contains__(self, key):
+        return key in self.scene.columns
+
+    def items(self):
+        return [(key, self[key]) for key in Scene.FIELDS]
+
+    def update(self, fields):
+        for key, value in fields.items():
+            self.scene.set(self.row, key, value)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __repr__(self):
+        return f"PrismRef({dict(self)!r})"
+
+SCENE_MAGIC = b"PRSM"
+SCENE_VERSION = 1
+_SCENE_PREAMBLE = struct.Struct("<4sHI") # magic, version, header length
+PRISM_DTYPE = np.dtype([('id', '<i8'), ('x', '<f8'), ('y', '<f8'), ('angle', '<f8'), ('type', 'i1'), ('intensity_factor', '<f8')])
+START_DTYPE = np.dtype([('id', '<i8'), ('x', '<f8'), ('y', '<f8'), ('angle', '<f8')])
+
+def save_scene(filepath, prisms_list, starts, **params):
+    """
+    Writes a binary scene: a preamble, a JSON header (params, type names, array
+    offsets) and the prisms and starts as packed little-endian records.
+    """
+    prisms, types = _prism_records(prisms_list)
+    start_arr = np.array([(s['id'], s['x'], s['y'], s['angle']) for s in starts], dtype=START_DTYPE)
+
+    header = {'params': params, 'types': types, 'prisms': len(prisms), 'start_configs': len(start_arr)}
+    # Offsets depend on the header length, which depends on the offsets: pad it to 8 bytes, then fix point.
+    header['prisms_offset'] = header['start_configs_offset'] = 0
+    while True:
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_bytes += b" " * (-(_SCENE_PREAMBLE.size + len(header_bytes)) % 8)
+        prisms_offset = _SCENE_PREAMBLE.size + len(header_bytes)
+        starts_offset = prisms_offset + prisms.nbytes
+        if (header['prisms_offset'], header['start_configs_offset']) == (prisms_offset, starts_offset):
+            break
+        header['prisms_offset'], header['start_configs_offset'] = prisms_offset, starts_offset
+
+    with open(filepath, "wb") as f:
+        f.write(_SCENE_PREAMBLE.pack(SCENE_MAGIC, SCENE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(prisms.tobytes())
+        f.write(start_arr.tobytes())
+
+def _prism_records(prisms_list):
+    """Packs prisms into a PRISM_DTYPE array. Returns (records, type names indexed by the codes)."""
+    if isinstance(prisms_list, Scene):
+        records = np.zeros(len(prisms_list), dtype=PRISM_DTYPE)
+        for key, col in prisms_list.columns.items():
+            records[key] = np.frombuffer(col, dtype=col.typecode) if len(col) else []
+        return records, list(prisms_list.types)
+    types = list(PRISM_TYPES)
+    for p in prisms_list:
+        if p.get('type', 'normal') not in types:
+            types.append(p['type'])
+    codes = {t: i for i, t in enumerate(types)}
+    records = np.array([(p['id'], p['x'], p['y'], p['angle'], codes[p.get('type', 'normal')], p.get('intensity_factor', 1.0)) for p in prisms_list], dtype=PRISM_DTYPE)
+    return records, types
+
+def is_scene_file(filepath):
+    with open(filepath, "rb") as f:
+        return f.read(len(SCENE_MAGIC)) == SCENE_MAGIC
+
+def load_scene(filepath):
+    """
+    Opens a binary scene. Returns a dict of its params plus 'prisms' and 'start_configs'
+    as read-only memory-mapped record arrays (PRISM_DTYPE, START_DTYPE) and 'types', the
+    prism type names indexed by the 'type' codes.
+    """
+    with open(filepath, "rb") as f:
+        magic, version, header_len = _SCENE_PREAMBLE.unpack(f.read(_SCENE_PREAMBLE.size))
+        if magic != SCENE_MAGIC:
+            raise ValueError(f"Not a prism scene file: {filepath}")
+        if version > SCENE_VERSION:
+            raise ValueError(f"Unsupported scene file version {version}")
+        header = json.loads(f.read(header_len))
+
+    def mapped(dtype, key):
+        if not header[key]: return np.zeros(0, dtype=dtype)
+        return np.memmap(filepath, dtype=dtype, mode="r", offset=header[key + '_offset'], shape=(header[key],))
+
+    return {**header['params'], 'types': header['types'], 'prisms': mapped(PRISM_DTYPE, 'prisms'), 'start_configs': mapped(START_DTYPE, 'start_configs')}
+
+def scene_records(records, types=PRISM_TYPES):
+    """Converts prism or start records from load_scene into the usual list of dicts."""
+    names = records.dtype.names
+    rows = [dict(zip(names, row)) for row in records.tolist()]
+    if 'type' in names:
+        for row in rows:
+            row['type'] = types[row['type']]
+    return rows
+
+TRACE_PARAMS = {'angle_tolerance': 0.01, 'max_iterations': 1000, 'attenuation_factor': 0.0, 'attenuation_threshold': 0.01} # Editor defaults
+
+def read_scene(filepath):
+    """
+    Loads a saved scene, JSON (including legacy start_cfg) or binary, as (starts,
+    prisms_list, params). The prisms of a binary scene come as a Scene built from
+    its columns, without going through dicts.
+    """
+    if is_scene_file(filepath):
+        data = load_scene(filepath)
+        prisms_list, starts = Scene.from_records(data['prisms'], data['types']), scene_records(data['start_configs'])
+    else:
+        with open(filepath, "r") as f: data = json.load(f)
+        prisms_list = data.get('prisms', [])
+        starts = [{'id': 1, **data['start_cfg']}] if 'start_cfg' in data else data.get('start_configs', [{'x': 0, 'y': 0, 'angle': 0, 'id': 1}])
+    params = {k: data.get(k, default) for k, default in TRACE_PARAMS.items()}
+    return starts, prisms_list, params
+
+def trace_file(filepath, engine="python", wavefront=False, limits=None):
+    """
+    Traces one scene file with its stored parameters, and the optional limits of
+    calculate_all_paths (laser_budget, deadline...). Returns a report dict with timings.
+    A file that cannot be read or traced gives a report with no results and its
+    error set (None otherwise), so one bad scene does not sink a batch.
+    """
+    t0 = time.perf_counter()
+    try:
+        starts, prisms_list, params = read_scene(filepath)
+        t1 = time.perf_counter()
+        results = calculate_all_paths(starts, prisms_list, engine=engine, wavefront=wavefront, **params, **(limits or {}))
+    except Exception as e: # Missing, corrupt or invalid scene
+        return {'file': filepath, 'prisms': 0, 'starts': [], 'params': None, 'load_seconds': time.perf_counter() - t0,
+                'trace_seconds': 0.0, 'results': [], 'error': f"{type(e).__name__}: {e}"}
+    t2 = time.perf_counter()
+    return {'file': filepath, 'prisms': len(prisms_list), 'starts': [s['id'] for s in starts], 'params': params,
+            'load_seconds': t1 - t0, 'trace_seconds': t2 - t1, 'results': results, 'error': None}
+
+SWEEP_PARAMS = tuple(TRACE_PARAMS)
+_SWEEP = {} # Scene of a sweep worker process, set up once by _sweep_init
+
+def sweep(starts, prisms_list, grid, params=None, max_workers=None, engine="python"):
+    """
+    Traces a scene at every point of a parameter grid on a process pool, yielding
+    (point, results) as points finish, not in grid order. grid maps a trace parameter
+    (see SWEEP_PARAMS) or ("angle", prism_id) to the values to try, and point is the
+    dict of values used. params sets the parameters not swept (defaults: TRACE_PARAMS).
+    The prisms reach each worker once through shared memory instead of with every
+    task, and at most two tasks per worker are in flight. max_workers=1 runs inline.
+    """
+    keys = list(grid)
+    ids = {p['id'] for p in prisms_list}
+    for key in keys:
+        if isinstance(key, tuple):
+            if len(key) != 2 or key[0] != "angle" or key[1] not in ids:
+                raise ValueError(f"Unknown sweep key: {key}")
+        elif key not in SWEEP_PARAMS:
+            raise ValueError(f"Unknown sweep parameter: {key}")
+    points = (tuple(zip(keys, values)) for values in product(*(grid[k] for k in keys)))
+    base = {**TRACE_PARAMS, **(params or {})}
+    records, types = _prism_records(prisms_list)
+    starts = [{'x': s['x'], 'y': s['y'], 'angle': s['angle']} for s in starts]
+
+    workers = max_workers or os.cpu_count()
+    if workers == 1:
+        _sweep_setup(records, types, starts, base, engine)
+        for point in points:
+            yield _sweep_point(point)
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, records.nbytes))
+    pool = None
+    try:
+        np.ndarray(records.shape, dtype=PRISM_DTYPE, buffer=shm.buf)[:] = records
+        pool = ProcessPoolExecutor(workers, initializer=_sweep_init, initargs=(shm.name, len(records), types, starts, base, engine))
+        pending = set()
+        for point in points:
+            pending.add(pool.submit(_sweep_point, point))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shm.close()
+        shm.unlink()
+
+def _sweep_init(shm_name, count, types, starts, base, engine):
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError: # Python < 3.13
+        shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        records = np.ndarray((count,), dtype=PRISM_DTYPE, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    _sweep_setup(records, types, starts, base, engine)
+
+def _sweep_setup(records, types, starts, base, engine):
+    prisms_list = scene_records(records, types)
+    # Sweeps only change angles and parameters, so the position index is built once.
+    index = PrismArrays(prisms_list) if engine == "numpy" else PrismGrid(prisms_list)
+    _SWEEP.update(starts=starts, prisms=prisms_list, rows={p['id']: i for i, p in enumerate(prisms_list)}, base=base, index=index)
+
+def _sweep_point(point):
+    prisms_list = _SWEEP['prisms']
+    params = dict(_SWEEP['base'])
+    saved = []
+    for key, value in point:
+        if isinstance(key, tuple):
+            p = prisms_list[_SWEEP['rows'][key[1]]]
+            saved.append((p, p['angle']))
+            p['angle'] = value
+        else:
+            params[key] = value
+    try:
+        results = _trace_paths(_SWEEP['starts'], prisms_list, _SWEEP['index'], params['angle_tolerance'], params['max_iterations'], params['attenuation_factor'], params['attenuation_threshold'])
+    finally:
+        for p, angle in reversed(saved):
+            p['angle'] = angle
+    return dict(point), results
+
+CSV_FIELDS = ("file", "laser", "kind", "index", "prism_id", "x1", "y1", "x2", "y2", "intensity_start", "intensity_end", "error", "reason",
+              "gain", "length", "hops", "cycles")
+
+def write_csv(reports, out):
+    """One row per segment, sequence hit, loop point, loop summary, error and truncation of every laser, and per failed file."""
+    writer = csv.DictWriter(out, CSV_FIELDS)
+    writer.writeheader()
+    for rep in reports:
+        if rep.get('error'):
+            writer.writerow({'file': rep['file'], 'kind': "error", 'error': rep['error']})
+        for laser, res in zip(rep['starts'], rep['results']):
+            row = {'file': rep['file'], 'laser': laser}
+            for k, (x1, y1, x2, y2, i1, i2) in enumerate(res['segments']):
+                writer.writerow({**row, 'kind': "segment", 'index': k, 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'intensity_start': i1, 'intensity_end': i2})
+            for k, pid in enumerate(res['sequence']):
+                writer.writerow({**row, 'kind': "hit", 'index': k, 'prism_id': pid})
+            for k, (x, y) in enumerate(res['loop_coords'] or []):
+                writer.writerow({**row, 'kind': "loop", 'index': k, 'x1': x, 'y1': y})
+            if res['loop_info']:
+                writer.writerow({**row, 'kind': "loop_info", **res['loop_info']})
+            if res['error']:
+                writer.writerow({**row, 'kind': "error", 'error': res['error']})
+            for reason in res['truncated']:
+                writer.writerow({**row, 'kind': "truncated", 'reason': reason})
+
+def stream_file(filepath, out, fmt="json", engine="python", wavefront=False, writer=None, limits=None):
+    """
+    Traces one scene with iter_paths, writing each event as it arrives: CSV rows as in
+    write_csv (pass the writer to share the header), or one JSON object per line.
+    Returns the number of events.
+    """
+    starts, prisms_list, params = read_scene(filepath)
+    lasers = [s.get('id') for s in starts]
+    counts = {}
+    n = 0
+    for kind, s_idx, value in iter_paths(starts, prisms_list, engine=engine, wavefront=wavefront, **params, **(limits or {})):
+        n += 1
+        if fmt != "csv":
+            out.write(json.dumps({'file': filepath, 'laser': lasers[s_idx], 'kind': kind, 'value': value}) + "\n")
+            continue
+        row = {'file': filepath, 'laser': lasers[s_idx], 'kind': kind}
+        k = counts.get((s_idx, kind), 0)
+        counts[s_idx, kind] = k + 1
+        if kind == "segment":
+            x1, y1, x2, y2, i1, i2 = value
+            writer.writerow({**row, 'index': k, 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2, 'intensity_start': i1, 'intensity_end': i2})
+        elif kind == "hit":
+            writer.writerow({**row, 'index': k, 'prism_id': value})
+        elif kind == "truncated":
+            writer.writerow({**row, 'reason': value})
+        elif kind == "loop":
+            for k, (x, y) in enumerate(value):
+                writer.writerow({**row, 'index': k, 'x1': x, 'y1': y})
+        elif kind == "loop_info":
+            writer.writerow({**row, **value})
+    return n
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trace saved prism scenes without the editor.")
+    parser.add_argument("files", nargs="+", help="scene files (.json or .prism), glob patterns allowed")
+    parser.add_argument("-f", "--format", choices=("json", "csv"), default="json")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--engine", choices=("python", "numpy"), default="python")
+    parser.add_argument("--wavefront", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="write results while tracing, one scene at a time (JSON lines with -f json)")
+    parser.add_argument("--laser-budget", type=int, help="max hits per laser")
+    parser.add_argument("--deadline", type=float, help="max seconds per scene")
+    parser.add_argument("--view", type=float, nargs=4, metavar=("XMIN", "YMIN", "XMAX", "YMAX"), help="stop beams at hits outside this rectangle")
+    parser.add_argument("--min-intensity", type=float, default=0, help="do not follow rays dimmer than this")
+    parser.add_argument("--loop-history", type=int, help="hops of history kept for loop detection, bounds memory on long beams")
+    args = parser.parse_args(argv)
+    limits = {'laser_budget': args.laser_budget, 'deadline': args.deadline, 'view': args.view, 'min_intensity': args.min_intensity,
+              'loop_history': args.loop_history}
+
+    files = []
+    for pattern in args.files:
+        files.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    t0 = time.perf_counter()
+    failed = 0
+    if args.stream:
+        out = open(args.output, "w", newline="") if args.output else sys.stdout
+        try:
+            writer = None
+            if args.format == "csv":
+                writer = csv.DictWriter(out, CSV_FIELDS)
+                writer.writeheader()
+            for f in files:
+                t1 = time.perf_counter()
+                try:
+                    n = stream_file(f, out, args.format, args.engine, args.wavefront, writer, limits)
+                except Exception as e: # Missing, corrupt or invalid scene: report it and go on
+                    error = f"{type(e).__name__}: {e}"
+                    failed += 1
+                    if writer is not None: writer.writerow({'file': f, 'kind': "error", 'error': error})
+                    else: out.write(json.dumps({'file': f, 'laser': None, 'kind': "error", 'value': error}) + "\n")
+                    print(f"{f}: {error}", file=sys.stderr)
+                    continue
+                print(f"{f}: {n} events, {time.perf_counter() - t1:.3f}s", file=sys.stderr)
+        finally:
+            if args.output: out.close()
+        print(f"{len(files)} scenes in {time.perf_counter() - t0:.3f}s" + (f", {failed} failed" if failed else ""), file=sys.stderr)
+        return 1 if failed else 0
+
+    if args.jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            reports = list(pool.map(trace_file, files, [args.engine] * len(files), [args.wavefront] * len(files), [limits] * len(files)))
+    else:
+        reports = [trace_file(f, args.engine, args.wavefront, limits) for f in files]
+    for rep in reports:
+        if rep['error']:
+            failed += 1
+            print(f"{rep['file']}: {rep['error']}", file=sys.stderr)
+            continue
+        segments = sum(len(res['segments']) for res in rep['results'])
+        print(f"{rep['file']}: {rep['prisms']} prisms, {segments} segments, load {rep['load_seconds']:.3f}s, trace {rep['trace_seconds']:.3f}s", file=sys.stderr)
+    print(f"{len(reports)} scenes in {time.perf_counter() - t0:.3f}s" + (f", {failed} failed" if failed else ""), file=sys.stderr)
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            write_csv(reports, out)
+        else:
+            json.dump(reports, out)
+            out.write("\n")
+    finally:
+        if args.output: out.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())